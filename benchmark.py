@@ -0,0 +1,174 @@
+from mock_server import MockServer
+from thu_questionnaire_downloader import schema
+
+import logging
+import datetime
+import json
+import os
+import sys
+import shutil
+import tempfile
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from rich.console import Console
+from rich.table import Table
+
+
+console = Console()
+QUESTIONNAIRE = "benchmark"
+
+
+def _peak_rss() -> float:
+    """ 当前进程的峰值常驻内存（MiB）；无法获取时返回 None。"""
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / (1 << 20) if sys.platform == "darwin" else peak / (1 << 10)
+    except ImportError:
+        pass
+    try:
+        import psutil
+        info = psutil.Process().memory_info()
+        return getattr(info, 'peak_wset', info.rss) / (1 << 20)
+    except ImportError:
+        return None
+
+
+def run_case(config: dict) -> dict:
+    """ 在独立进程中以接口模式运行一次完整的 `main` 流程，返回运行指标和峰值内存。
+
+    Args:
+        config (dict): `main` 的参数，须已在 _save_dir_ 中写入指向模拟服务的 `session_cache.json`
+
+    Returns:
+        result (dict): 包含 _metrics_（格式同 `Metrics.snapshot`）和 _peak_rss_（MiB）字段
+    """
+    import thu_questionnaire_downloader as downloader
+
+    logging.getLogger().setLevel(config.pop('log_level', logging.WARNING))
+    downloader.main(**config)
+    return {"metrics": downloader.metrics.snapshot(), "peak_rss": _peak_rss()}
+
+
+def benchmark(sizes: tuple = (10, 1000, 10000), date_length: int = 7, latency: float = 0,
+              video_size: int = 16 << 10, cover_size: int = 4 << 10, max_workers: int = 4,
+              download_workers: int = 4, page_size: int = 100, range_query: bool = False,
+              fixture_dir: str = None, work_dir: str = None, keep: bool = False, field_schema: str = None) -> list:
+    """ 对每种数据规模启动一个模拟服务，在独立进程中运行完整的 `main` 流程，统计吞吐量、峰值内存和各阶段耗时。
+
+    每次运行都使用新的保存目录，因此不受增量同步的影响；PDF 转换不计入。
+
+    Args:
+        sizes (tuple, optional): 生成的预约条数，每个值运行一次，默认为 10、1000、10000；提供 _fixture_dir_ 时忽略，只运行一次
+        date_length (int, optional): 数据分布和查询的天数，默认为 7
+        latency (float, optional): 模拟服务每个请求的额外延迟（秒），默认为 0
+        video_size (int, optional): 模拟视频文件大小（字节），默认为 16 KiB
+        cover_size (int, optional): 模拟封面文件大小（字节），默认为 4 KiB
+        max_workers (int, optional): 传给 `main` 的并发查询线程数，默认为 4
+        download_workers (int, optional): 传给 `main` 的并发下载线程数，默认为 4
+        page_size (int, optional): 传给 `main` 的分页大小，默认为 100
+        range_query (bool, optional): 传给 `main` 的是否使用日期范围查询，默认为 False
+        fixture_dir (str, optional): 回放的夹具目录；默认为空，此时使用生成的数据
+        work_dir (str, optional): 保存目录的上级目录；默认为空，此时使用临时目录
+        keep (bool, optional): 是否保留各次运行的保存目录，默认为 False
+        field_schema (str, optional): 字段映射文件路径，同时用于模拟服务和 `main`；默认为空，此时使用默认映射
+
+    Returns:
+        results (list): 每次运行的结果，包含 _bookings_、_wall_time_、_throughput_、_bytes_、_peak_rss_、_stages_、_counters_ 字段
+    """
+    temporary = work_dir is None
+    work_dir = work_dir or tempfile.mkdtemp(prefix="thu_qd_bench_")
+    date_start = datetime.date.today().strftime("%Y-%m-%d")
+    results = []
+    context = multiprocessing.get_context("spawn")
+    schema.configure(field_schema)
+    for size in (sizes if not fixture_dir else (None,)):
+        save_dir = os.path.join(work_dir, f"bookings_{size or 'fixture'}")
+        shutil.rmtree(save_dir, ignore_errors=True)
+        with MockServer(size or 0, date_start, date_length, fixture_dir, latency, video_size, cover_size) as mock:
+            mock.write_session_cache(save_dir, QUESTIONNAIRE)
+            config = {
+                "questionnaire": QUESTIONNAIRE, "password": "", "date_start": mock.date_start, "date_length": date_length,
+                "save_dir": save_dir, "api_mode": True, "max_workers": max_workers, "rate_limit": 0,
+                "download_workers": download_workers, "page_size": page_size, "range_query": range_query,
+                "cloud_url": mock.url, "export_pdf": False, "field_schema": field_schema,
+            }
+            console.print(f"[bold]运行性能测试：{len(mock.bookings)} 条预约[/bold]")
+            # 每次运行使用全新的进程，峰值内存互不影响
+            with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+                run = executor.submit(run_case, config).result()
+            requests_served = mock.requests
+
+        snapshot = run['metrics']
+        counters = snapshot['counters']
+        transferred = counters.get('cloud_bytes', 0) + counters.get('attachment_bytes', 0)
+        results.append({
+            "bookings": counters.get('bookings', 0),
+            "wall_time": snapshot['wall_time'],
+            "throughput": counters.get('bookings', 0) / snapshot['wall_time'] if snapshot['wall_time'] else 0,
+            "bytes": transferred,
+            "requests": requests_served,
+            "peak_rss": run['peak_rss'],
+            "stages": snapshot['stages'],
+            "counters": counters,
+        })
+        if not keep:
+            shutil.rmtree(save_dir, ignore_errors=True)
+    if temporary and not keep:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    return results
+
+
+def print_results(results: list):
+    """ 在控制台打印吞吐量汇总表和各阶段耗时表。"""
+    table = Table(title="性能测试结果")
+    for column in ("预约数", "总耗时 (s)", "吞吐量 (条/s)", "传输 (MiB)", "请求数", "峰值内存 (MiB)"):
+        table.add_column(column, justify="right")
+    for result in results:
+        table.add_row(str(result['bookings']), f"{result['wall_time']:.2f}", f"{result['throughput']:.1f}",
+                      f"{result['bytes'] / (1 << 20):.1f}", str(result['requests']),
+                      f"{result['peak_rss']:.1f}" if result['peak_rss'] is not None else "-")
+    console.print(table)
+
+    stages = sorted({stage for result in results for stage in result['stages']})
+    table = Table(title="各阶段总耗时 (s)")
+    table.add_column("阶段")
+    for result in results:
+        table.add_column(f"{result['bookings']} 条", justify="right")
+    for stage in stages:
+        table.add_row(stage, *(f"{result['stages'][stage]['total']:.2f}" if stage in result['stages'] else "-"
+                               for result in results))
+    console.print(table)
+
+
+if __name__ == "__main__":
+    """ 运行性能测试。
+
+    python benchmark.py --sizes 10 1000 10000 --latency 0.01 --output benchmark.json
+    """
+    import argparse
+
+    parser = argparse.ArgumentParser(description="基于本地模拟服务的离线性能测试")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 1000, 10000])
+    parser.add_argument("--date-length", type=int, default=7)
+    parser.add_argument("--latency", type=float, default=0)
+    parser.add_argument("--video-size", type=int, default=16 << 10)
+    parser.add_argument("--cover-size", type=int, default=4 << 10)
+    parser.add_argument("--max-workers", type=int, default=4)
+    parser.add_argument("--download-workers", type=int, default=4)
+    parser.add_argument("--page-size", type=int, default=100)
+    parser.add_argument("--range-query", action="store_true")
+    parser.add_argument("--fixture-dir", default=None)
+    parser.add_argument("--work-dir", default=None)
+    parser.add_argument("--keep", action="store_true")
+    parser.add_argument("--field-schema", default=None)
+    parser.add_argument("--output", default="benchmark.json")
+    args = parser.parse_args()
+
+    results = benchmark(tuple(args.sizes), args.date_length, args.latency, args.video_size, args.cover_size,
+                        args.max_workers, args.download_workers, args.page_size, args.range_query,
+                        args.fixture_dir, args.work_dir, args.keep, args.field_schema)
+    print_results(results)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+    console.print(f"结果已写入 {args.output}")
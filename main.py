@@ -1,4 +1,4 @@
-from thu_questionnaire_downloader import main
+from thu_questionnaire_downloader import main, main_batch, watch
 import json
 
 if __name__ == "__main__":
@@ -7,11 +7,56 @@ if __name__ == "__main__":
     在配置文件 `config.json` 中指定以下参数：
     - `questionnaire` (str): 问卷查询链接的标识符
     - `password` (str): 问卷查询的密码
-    - `downloader_script_dir` (str): THU-Cloud-Downloader 脚本所在目录
+    - `downloader_script_dir` (str, optional): THU-Cloud-Downloader 脚本所在目录，仅在 `cloud_downloader` 为 "script" 时使用
     - `date_start` (str, optional): 查询的起始日期，格式为 "YYYY-MM-DD"，默认为当前日期
     - `date_length` (int, optional): 查询的日期范围长度（天数），默认为 7 天
     - `save_dir` (str, optional): 下载文件的保存目录，默认为当前目录下的 "output" 文件夹
+    - `api_mode` (bool, optional): 是否启用接口模式，浏览器仅用于验证密码和捕获请求模板，之后直接调用接口查询，默认为 False
+    - `max_workers` (int, optional): 并发查询的最大工作线程数，浏览器模式下即标签页数，默认为 4
+    - `rate_limit` (float, optional): 每台主机每秒允许的最大请求数，不大于 0 时不限速，默认为 5
+    - `download_workers` (int, optional): 并发下载视频的工作线程数，默认为 2
+    - `download_retries` (int, optional): 视频下载失败后的最大重试次数，默认为 2
+    - `incremental` (bool, optional): 是否启用增量同步，跳过 `sync_index.json` 中记录的未变化预约和已保存文件，默认为 True
+    - `cloud_downloader` (str, optional): 云盘视频的下载方式，"builtin" 为进程内下载器，"script" 为调用 THU-Cloud-Downloader，默认为 "builtin"
+    - `page_size` (int, optional): 接口模式下分页查询的每页条数，默认为 100
+    - `range_query` (bool, optional): 接口模式下是否尝试以一次日期范围查询取代逐日查询，默认为 False
+    - `session_cache` (bool, optional): 是否将查询凭据缓存到 `session_cache.json`，未过期时接口模式无需启动浏览器验证密码，默认为 True
+    - `profile_dir` (str, optional): 浏览器用户数据目录，登录状态随目录保留，默认使用 DrissionPage 的默认配置
+    - `browser_port` (int, optional): 浏览器调试端口，该端口上已有浏览器运行时直接接管，默认使用 DrissionPage 的默认端口
+    - `keep_browser` (bool, optional): 结束时是否保留浏览器及其标签页，供下次运行复用，默认为 False
+    - `cloud_url` (str, optional): 云盘服务地址，进程内下载器只接受以该地址开头的共享链接，默认为 "https://cloud.tsinghua.edu.cn"
+    - `export_pdf` (bool, optional): 是否导出 PDF 报告，默认为 True
+    - `record_dir` (str, optional): 离线夹具的录制目录，指定后将问卷系统和云盘的响应录制到该目录，供 `mock_server.py` 回放，默认不录制
+    - `wait_timeout` (float, optional): 浏览器中等待页面元素和网络请求的初始及最长超时时间（秒），之后根据观测到的耗时自动缩短，默认为 10
+    - `wait_retries` (int, optional): 等待超时后重新触发并重试的最大次数，默认为 2
+    - `report_renderer` (str, optional): 报告的渲染方式，"pandoc" 为通过 Pandoc 导出 PDF，"html" 为内置渲染器生成 HTML 并由浏览器打印 PDF，默认为 "pandoc"
+    - `image_processing` (bool, optional): 是否为封面生成缩略图和 3:4、4:3 裁剪版本并在报告中嵌入预览，需要安装 Pillow，默认为 False
+    - `thumbnail_size` (int, optional): 缩略图长边的最大像素数，默认为 320
+    - `image_workers` (int, optional): 图片处理的进程数，默认为 CPU 核数
+    - `field_schema` (dict | str, optional): 字段映射规则或其 JSON 文件路径，按问题 ID 或问题文本匹配各字段，规则格式见 `FieldSchema`，默认按当前问卷的问题顺序匹配
+    - `media_store` (bool, optional): 是否将视频、封面保存到按内容寻址的媒体存储 `save_dir/.media/` 中并链接到各预约文件夹，相同内容只保存一份、已下载过的共享文件不再下载，默认为 True
+    - `media_links` (str, optional): 媒体存储的链接方式，"hardlink" 或 "symlink"，无法创建时退回复制，默认为 "hardlink"
+
+    配置文件中包含 `questionnaires` 列表时以批量模式运行 `main_batch`：列表中每项为一个问卷的 `questionnaire`、`password`
+    及该问卷专用的其他参数，输出到 `{save_dir}/{questionnaire}`；顶层的其他参数对全部问卷生效，另可指定：
+    - `query_workers` (int, optional): 全部问卷共享的查询线程池大小，默认为 8
+    - `max_questionnaires` (int, optional): 同时处理的最大问卷数，默认全部同时处理
+    批量模式中 `rate_limit`、`download_workers`、`download_retries`、`downloader_script_dir`、`cloud_downloader`、`cloud_url`、
+    `profile_dir`、`browser_port`、`keep_browser`、`record_dir`、`wait_timeout`、`wait_retries` 和 `field_schema` 只能在顶层指定，由全部问卷共享。
+
+    配置文件中 `watch` 为 true 时以监视模式运行 `watch`：常驻运行并定期轮询新的预约，有变化时才下载并重新生成报告，另可指定：
+    - `watch_days` (int, optional): 每轮查询今天起的天数，默认为 2
+    - `poll_interval` (float, optional): 最短轮询间隔（秒），有变化时重置为该值，默认为 10
+    - `max_interval` (float, optional): 最长轮询间隔（秒），默认为 300
+    - `backoff` (float, optional): 没有变化时轮询间隔的增长倍数，默认为 2
+    - `rescan_interval` (float, optional): 完整查询 `date_length` 天的间隔（秒），默认为 3600
+    - `max_polls` (int, optional): 最大轮询次数，默认一直运行，按 Ctrl+C 结束
     """
     with open("config.json", "r", encoding="utf-8") as f:
         config = json.load(f)
-    main(**config)
\ No newline at end of file
+    if "questionnaires" in config:
+        main_batch(**config)
+    elif config.pop("watch", False):
+        watch(**config)
+    else:
+        main(**config)
\ No newline at end of file
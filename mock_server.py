@@ -0,0 +1,348 @@
+from thu_questionnaire_downloader import CLOUD_URL, UPLOAD_ROLES, schema
+
+import logging
+import datetime
+import hashlib
+import json
+import os
+import re
+import glob
+import time
+import threading
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs, quote
+
+
+COVER_SOURCES = ("此处上传", "已附在云盘链接中，文件名：:cover.jpg", "该封面无需上传")
+
+
+def synthetic_bookings(count: int, date_start: str, date_length: int = 7) -> list:
+    """ 生成 _count_ 条结构与真实问卷一致的预约数据，依次均匀分布在从 _date_start_ 起的 _date_length_ 天中。
+
+    视频链接指向 `CLOUD_URL`，由 `MockServer` 改写为模拟云盘的地址；封面来源在“此处上传”“已附在云盘链接中”“无需上传”之间轮换，
+    视频链接在文件（`f`）共享和文件夹（`d`）共享之间轮换。
+
+    Returns:
+        bookings (list): 预约数据列表，格式同 `search` 接口响应体中的 _query_result_
+    """
+    start = datetime.datetime.strptime(date_start, "%Y-%m-%d").date()
+    bookings = []
+    for seq in range(1, count + 1):
+        date = (start + datetime.timedelta(days=(seq - 1) * date_length // max(1, count))).strftime("%Y-%m-%d")
+        token = hashlib.sha1(str(seq).encode()).hexdigest()[:20]
+        share_type = "d" if seq % 2 else "f"
+        cover1, cover2 = COVER_SOURCES[seq % 3], COVER_SOURCES[(seq + 1) % 3]
+        if share_type == "f":
+            # 文件共享中没有附带的封面
+            cover1, cover2 = [source if not source.startswith("已附在云盘链接中") else "此处上传" for source in (cover1, cover2)]
+        answers = [
+            f"姓名: 测试用户{seq}<br/>电话: 1380000{seq:04d}",
+            date,
+            "不定时" if seq % 4 else "定时至：:12:00",
+            f"{CLOUD_URL}/{share_type}/{token}/",
+            f"第 {seq} 条预约的描述文本。\n第二段描述。",
+            f"短标题{seq}",
+            "横屏展示卡片",
+            cover1,
+            f"cover1_{seq}.jpg" if cover1 == "此处上传" else "",
+            "无",
+            cover2,
+            f"cover2_{seq}.jpg" if cover2 == "此处上传" else "",
+            "无",
+            "实践纪实" if seq % 5 == 0 else "日常",
+            "是", "是",
+            "无",
+        ]
+        bookings.append({
+            "rid": hashlib.md5(f"rid-{seq}".encode()).hexdigest(),
+            "seq": seq,
+            "questions": [{"title": f"Q{index + 1}", "answer": answer} for index, answer in enumerate(answers)],
+        })
+    return bookings
+
+
+class MockServer:
+    """ 本地模拟的问卷系统和清华云盘服务，在后台线程中运行，供离线测试和性能测试使用。
+
+    提供的接口：
+    + `sr/api/{questionnaire}/validate/`、`sr/api/{questionnaire}/query/`：返回录制的响应体或空结果；
+    + `sr/api/{questionnaire}/search/`：按 _start_、_end_ 日期和 _page_、_pageSize_ 分页返回预约数据；
+    + `wjxt/file/rspd/upload_file/`：按 _file_ 参数返回上传附件的内容；
+    + `api/v2.1/share-links/{token}/dirents/`、`d/{token}/files/`、`f/{token}/`：云盘共享的目录列表和文件下载，支持 `Range` 续传。
+
+    提供 _fixture_dir_ 时回放 `FixtureRecorder` 录制的夹具：预约数据取自全部 `search` 夹具（按 _rid_ 去重），
+    附件和共享文件列表取自对应夹具，夹具中缺少的附件、文件按 _cover_size_、_video_size_ 生成内容；
+    否则使用 `synthetic_bookings` 生成的 _bookings_ 条预约数据。
+
+    Args:
+        bookings (int, optional): 生成的预约条数，默认为 10
+        date_start (str, optional): 生成数据的起始日期，格式为 "YYYY-MM-DD"，默认为当前日期
+        date_length (int, optional): 生成数据分布的天数，默认为 7
+        fixture_dir (str, optional): 夹具目录；默认为空，此时使用生成的数据
+        latency (float, optional): 每个请求的额外延迟（秒），默认为 0
+        video_size (int, optional): 生成的视频文件大小（字节），默认为 256 KiB
+        cover_size (int, optional): 生成的封面文件大小（字节），默认为 16 KiB
+        host (str, optional): 监听地址，默认为 "127.0.0.1"
+        port (int, optional): 监听端口，默认为 0，即由系统分配
+    """
+
+    def __init__(self, bookings: int = 10, date_start: str = None, date_length: int = 7, fixture_dir: str = None,
+                 latency: float = 0, video_size: int = 256 << 10, cover_size: int = 16 << 10,
+                 host: str = "127.0.0.1", port: int = 0):
+        self.date_start = date_start or datetime.date.today().strftime("%Y-%m-%d")
+        self.date_length = date_length
+        self.fixture_dir = fixture_dir
+        self.latency = latency
+        self.video_size = video_size
+        self.cover_size = cover_size
+        self.blocks = {}        # { 大小: 生成的文件内容, ... }
+        self.requests = 0
+        self.lock = threading.Lock()
+
+        self.server = ThreadingHTTPServer((host, port), self._handler())
+        self.server.daemon_threads = True
+        self.url = f"http://{host}:{self.server.server_port}"
+        self.thread = None
+
+        if fixture_dir:
+            self.bookings = self._load_fixture_bookings()
+        else:
+            self.bookings = synthetic_bookings(bookings, self.date_start, date_length)
+        for item in self.bookings:
+            # 录制时的云盘地址（或生成数据中的 CLOUD_URL）改写为本服务地址
+            link = schema.bind(item['questions'])['video_link']
+            link['answer'] = re.sub(r"^\s*https?://[^/]+(?=/[df]/)", self.url, link['answer'])
+        self.by_date = {}       # { date: [item, ...], ... }
+        for item in self.bookings:
+            self.by_date.setdefault(schema.bind(item['questions']).answer('date'), []).append(item)
+
+    def _load_fixture_bookings(self) -> list:
+        bookings = {}
+        for path in sorted(glob.glob(os.path.join(self.fixture_dir, "search", "*.json"))):
+            with open(path, "r", encoding="utf-8") as f:
+                body = json.load(f)
+            for item in (body.get('data') or {}).get('query_result') or []:
+                bookings.setdefault(item['rid'], item)
+        logging.info(f"已加载录制的预约数据：\n- fixture dir: {self.fixture_dir}\n- bookings: {len(bookings)}")
+        return sorted(bookings.values(), key=lambda item: item['seq'])
+
+    def credentials(self, questionnaire: str) -> dict:
+        """ 返回指向本服务的查询凭据，格式同 `verify_password`，可直接写入 `session_cache.json`，使 `main` 无需启动浏览器。"""
+        api = f"{self.url}/sr/api/{questionnaire}"
+        return {
+            "appkey": "mock-appkey",
+            "signature": "mock-signature",
+            "cookies": [],
+            "user_agent": "MockClient/1.0",
+            "templates": {
+                "search": {
+                    "method": "GET", "url": f"{api}/search/",
+                    "params": {"appkey": "mock-appkey", "signature": "mock-signature",
+                               "start": self.date_start, "end": self.date_start, "page": "1", "pageSize": "20"},
+                    "data": None, "headers": {},
+                },
+                "search_date": self.date_start,
+                "upload_file": {
+                    "method": "GET", "url": f"{self.url}/wjxt/file/rspd/upload_file/",
+                    "params": {"appkey": "mock-appkey", "file": "{upload_file_name}"},
+                    "data": None, "headers": {},
+                },
+                "upload_file_name": "{upload_file_name}",
+            },
+        }
+
+    def write_session_cache(self, save_dir: str, questionnaire: str, ttl: float = 12 * 3600):
+        """ 将 `credentials` 写入 `{save_dir}/session_cache.json`。"""
+        os.makedirs(save_dir, exist_ok=True)
+        cache = {questionnaire: {"expires": time.time() + ttl, "credentials": self.credentials(questionnaire)}}
+        with open(os.path.join(save_dir, "session_cache.json"), "w", encoding="utf-8") as f:
+            json.dump(cache, f, ensure_ascii=False, indent=2)
+
+    def start(self) -> "MockServer":
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        logging.info(f"模拟服务已启动：\n- url: {self.url}\n- bookings: {len(self.bookings)}")
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _block(self, size: int) -> bytes:
+        with self.lock:
+            if size not in self.blocks:
+                self.blocks[size] = bytes(index % 251 for index in range(size))
+            return self.blocks[size]
+
+    def _fixture(self, kind: str, name: str):
+        """ 读取夹具文件，不存在时返回 None。"""
+        if not self.fixture_dir:
+            return None
+        path = os.path.join(self.fixture_dir, kind, quote(str(name), safe=""))
+        if os.path.isfile(path + ".json"):
+            with open(path + ".json", "r", encoding="utf-8") as f:
+                return json.load(f)
+        if os.path.isfile(path):
+            with open(path, "rb") as f:
+                return f.read()
+        return None
+
+    def search(self, start: str, end: str, page: int, page_size: int) -> dict:
+        result = [item for date, items in self.by_date.items() if start <= date <= end for item in items]
+        result.sort(key=lambda item: item['seq'])
+        offset = (page - 1) * page_size
+        return {"code": 0, "data": {"totalCount": len(result), "query_result": result[offset:offset + page_size]}}
+
+    def share(self, token: str) -> dict:
+        """ 共享链接的类型和文件列表。"""
+        recorded = self._fixture("cloud", token)
+        if recorded is not None:
+            return recorded
+        item = next((item for item in self.bookings if f"/{token}/" in schema.bind(item['questions']).answer('video_link')), None)
+        if item is None:
+            return None
+        fields = schema.bind(item['questions'])
+        if f"/f/{token}/" in fields.answer('video_link'):
+            return {"type": "f", "files": [{"path": "/video.mp4", "name": "video.mp4", "size": self.video_size}]}
+        files = [{"path": "/video.mp4", "name": "video.mp4", "size": self.video_size}]
+        for source, _ in UPLOAD_ROLES.values():
+            answer = fields.answer(source)
+            if answer.startswith("已附在云盘链接中"):
+                name = answer.split("文件名：:")[-1]
+                files.append({"path": f"/{name}", "name": name, "size": self.cover_size})
+        return {"type": "d", "files": files}
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True
+
+            def log_message(self, format, *args):
+                logging.debug(f"模拟服务请求：{format % args}")
+
+            def do_GET(self):
+                with server.lock:
+                    server.requests += 1
+                if server.latency:
+                    time.sleep(server.latency)
+                url = urlparse(self.path)
+                query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+                try:
+                    self.route(url.path, query)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+
+            do_POST = do_HEAD = do_GET
+
+            def route(self, path: str, query: dict):
+                if match := re.fullmatch(r"/sr/api/[^/]+/(validate|query)/", path):
+                    self.send_json(server._fixture(match.group(1), path.split("/")[3]) or {"code": 0, "data": {}})
+                elif re.fullmatch(r"/sr/api/[^/]+/search/", path):
+                    start = query.get('start', server.date_start)
+                    self.send_json(server.search(start, query.get('end', start),
+                                                 int(query.get('page', 1)), int(query.get('pageSize', 20))))
+                elif path == "/wjxt/file/rspd/upload_file/":
+                    content = server._fixture("upload_file", query.get('file', ''))
+                    self.send_bytes(content if isinstance(content, bytes) else server._block(server.cover_size))
+                elif match := re.fullmatch(r"/api/v2\.1/share-links/([0-9A-Za-z]+)/dirents/", path):
+                    share = server.share(match.group(1))
+                    if share is None:
+                        return self.send_error(404)
+                    directory = query.get('path', '/').rstrip("/") or "/"
+                    self.send_json({"dirent_list": [
+                        {"is_dir": False, "file_path": file['path'], "file_name": file['name'], "size": file['size']}
+                        for file in share['files'] if os.path.dirname(file['path']) == directory
+                    ]})
+                elif match := re.fullmatch(r"/([df])/([0-9A-Za-z]+)/(?:files/)?", path):
+                    share = server.share(match.group(2))
+                    if share is None or share['type'] != match.group(1):
+                        return self.send_error(404)
+                    wanted = query.get('p', share['files'][0]['path'])
+                    file = next((file for file in share['files'] if file['path'] == wanted), None)
+                    if file is None:
+                        return self.send_error(404)
+                    self.send_bytes(server._block(file['size'] or 0), download=True)
+                else:
+                    self.send_error(404)
+
+            def send_json(self, body):
+                self.send_bytes(json.dumps(body, ensure_ascii=False).encode("utf-8"), "application/json")
+
+            def send_bytes(self, content: bytes, content_type: str = "application/octet-stream", download: bool = False):
+                status, offset = 200, 0
+                etag = f'"{len(content):x}-{zlib.crc32(content):08x}"' if download else None
+                match = re.fullmatch(r"bytes=(\d+)-", self.headers.get("Range", "")) if download else None
+                if match and self.headers.get("If-Range", etag) != etag:
+                    # 文件已变化，忽略 Range 返回完整内容
+                    match = None
+                if match:
+                    offset = int(match.group(1))
+                    if offset >= len(content):
+                        self.send_response(416)
+                        self.send_header("Content-Range", f"bytes */{len(content)}")
+                        self.send_header("Content-Length", "0")
+                        self.end_headers()
+                        return
+                    status = 206
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(content) - offset))
+                if etag:
+                    self.send_header("ETag", etag)
+                if status == 206:
+                    self.send_header("Content-Range", f"bytes {offset}-{len(content) - 1}/{len(content)}")
+                self.end_headers()
+                if self.command == "HEAD":
+                    return
+                view = memoryview(content)
+                for start in range(offset, len(content), 1 << 16):
+                    self.wfile.write(view[start:start + (1 << 16)])
+
+        return Handler
+
+
+if __name__ == "__main__":
+    """ 独立运行模拟服务。
+
+    python mock_server.py --bookings 100 --latency 0.05 --port 8000 --save-dir output_mock --questionnaire mock
+
+    指定 `--save-dir` 时写入对应的 `session_cache.json`，之后以相同的 `questionnaire`、`save_dir`、`api_mode=True`
+    和 `cloud_url` 运行 `main` 即可离线完成全部流程。
+    """
+    import argparse
+
+    parser = argparse.ArgumentParser(description="本地模拟的问卷系统和清华云盘服务")
+    parser.add_argument("--bookings", type=int, default=10)
+    parser.add_argument("--date-start", default=None)
+    parser.add_argument("--date-length", type=int, default=7)
+    parser.add_argument("--fixture-dir", default=None)
+    parser.add_argument("--latency", type=float, default=0)
+    parser.add_argument("--video-size", type=int, default=256 << 10)
+    parser.add_argument("--cover-size", type=int, default=16 << 10)
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--save-dir", default=None)
+    parser.add_argument("--questionnaire", default="mock")
+    parser.add_argument("--field-schema", default=None)
+    args = parser.parse_args()
+
+    # 回放的夹具与默认字段映射不一致时，使用与 main 相同的字段映射文件
+    schema.configure(args.field_schema)
+    mock = MockServer(args.bookings, args.date_start, args.date_length, args.fixture_dir, args.latency,
+                      args.video_size, args.cover_size, port=args.port)
+    if args.save_dir:
+        mock.write_session_cache(args.save_dir, args.questionnaire)
+    print(f"cloud_url: {mock.url}\ndate_start: {mock.date_start}")
+    mock.start()
+    try:
+        mock.thread.join()
+    except KeyboardInterrupt:
+        mock.stop()
@@ -1,19 +1,71 @@
 import subprocess
 import os
+import shutil
 from DrissionPage import ChromiumPage, ChromiumOptions
+from DrissionPage.errors import ElementLostError
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 import logging
 from rich.console import Console
 from rich.logging import RichHandler
+from rich.table import Table
 
 import datetime
 import re
 import json
+import copy
+import math
+import io
+import csv
+import functools
+import hashlib
+import time
+import queue
+import threading
+import collections
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+from urllib.parse import urlparse, quote
+import html
+import pathlib
 import pypandoc
+try:
+    from pypdf import PdfWriter
+except ImportError:
+    PdfWriter = None    # 未安装 pypdf 时无法合并分节的 PDF，Pandoc 方式整体转换
+try:
+    from PIL import Image, ImageOps
+except ImportError:
+    Image = ImageOps = None     # 未安装 Pillow 时不做封面图片处理
 
 
 console = Console()
 NEWLINE = "\n"
+DEFAULT_FIELDS = {     # { 字段名: 匹配规则, ... }，默认按当前问卷的问题顺序匹配，规则格式见 `FieldSchema`
+    "contact": {"index": 0},                # 联系人
+    "date": {"index": 1},                   # 预约日期
+    "schedule": {"index": 2},               # 定时发布
+    "video_link": {"index": 3},             # 视频云盘链接
+    "description": {"index": 4},            # 描述文本
+    "short_title": {"index": 5},            # 短标题
+    "display": {"index": 6},                # 展示方式
+    "cover1_source": {"index": 7},          # 个人主页卡片封面来源
+    "cover1_upload": {"index": 8},          # 个人主页卡片封面上传
+    "cover1_crop": {"index": 9},            # 个人主页卡片封面裁剪说明
+    "cover2_source": {"index": 10},         # 横屏分享卡片封面来源
+    "cover2_upload": {"index": 11},         # 横屏分享卡片封面上传
+    "cover2_crop": {"index": 12},           # 横屏分享卡片封面裁剪说明
+    "collection": {"index": 13},            # 合集
+    "unit_review": {"index": 14},           # 实践单位审核确认
+    "group_review": {"index": 15},          # 实践组审核确认
+    "article_link": {"index": 16},          # 公众号文章链接
+}
+REQUIRED_FIELDS = ("date", "video_link", "short_title")     # 缺少时无法确定保存路径和下载视频的字段
+UPLOAD_ROLES = {'cover1': ('cover1_source', 'cover1_upload'), 'cover2': ('cover2_source', 'cover2_upload')}     # { 封面文件: (来源字段, 上传字段), ... }
+PAGE_KEYS = ("page", "pageNum", "pageNo", "page_num", "pageIndex", "current")      # search 请求中可能的页码字段名
+PAGE_SIZE_KEYS = ("pageSize", "page_size", "size", "limit", "perPage")             # search 请求中可能的每页条数字段名
 
 
 logging.basicConfig(
@@ -24,18 +76,382 @@ logging.basicConfig(
 )
 
 
+class Metrics:
+    """ 运行指标：各阶段的耗时计时器和计数器（传输字节数、重试次数等），各线程共享同一实例。
+
+    运行结束时由 `report` 写出 `metrics.json`、`metrics.csv` 并打印汇总表，用于发现性能退化和调整并发参数。
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """ 清空全部指标，并以当前时刻作为本次运行的开始时刻。"""
+        with self.lock:
+            self.started = time.time()
+            self.start_time = time.perf_counter()
+            self.stages = {}    # { stage: { "count": ..., "total": ..., "max": ..., "errors": ... }, ... }
+            self.counters = {}  # { name: value, ... }
+
+    @contextmanager
+    def timer(self, stage: str):
+        """ 统计 `with` 块的耗时，计入阶段 _stage_；块内抛出异常时同时计入该阶段的错误次数。"""
+        start = time.perf_counter()
+        failed = False
+        try:
+            yield
+        except BaseException:
+            failed = True
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            with self.lock:
+                record = self.stages.setdefault(stage, {"count": 0, "total": 0.0, "max": 0.0, "errors": 0})
+                record['count'] += 1
+                record['total'] += elapsed
+                record['max'] = max(record['max'], elapsed)
+                record['errors'] += failed
+
+    def timed(self, stage: str):
+        """ 装饰器形式的 `timer`，统计每次函数调用的耗时。"""
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.timer(stage):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def count(self, name: str, value: int = 1):
+        """ 计数器 _name_ 增加 _value_。"""
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def snapshot(self) -> dict:
+        """ 返回当前指标的副本，包含开始时刻 _started_、总耗时 _wall_time_、各阶段 _stages_ 和计数器 _counters_。"""
+        with self.lock:
+            return {
+                "started": datetime.datetime.fromtimestamp(self.started).isoformat(timespec="seconds"),
+                "wall_time": time.perf_counter() - self.start_time,
+                "stages": copy.deepcopy(self.stages),
+                "counters": dict(self.counters),
+            }
+
+    def report(self, save_dir: str) -> dict:
+        """ 将指标写入 `{save_dir}/metrics.json` 和 `{save_dir}/metrics.csv`，并在控制台打印汇总表。
+
+        Returns:
+            snapshot (dict): 写出的指标，格式同 `snapshot`
+        """
+        snapshot = self.snapshot()
+        _atomic_write(os.path.join(save_dir, "metrics.json"), json.dumps(snapshot, ensure_ascii=False, indent=2))
+        rows = [["kind", "name", "count", "total", "mean", "max", "errors"]]
+        for stage, record in sorted(snapshot['stages'].items()):
+            rows.append(["stage", stage, record['count'], f"{record['total']:.3f}",
+                         f"{record['total'] / record['count']:.3f}", f"{record['max']:.3f}", record['errors']])
+        for name, value in sorted(snapshot['counters'].items()):
+            rows.append(["counter", name, value, "", "", "", ""])
+        rows.append(["run", "wall_time", 1, f"{snapshot['wall_time']:.3f}", "", "", ""])
+        buffer = io.StringIO()
+        csv.writer(buffer, lineterminator="\n").writerows(rows)
+        _atomic_write(os.path.join(save_dir, "metrics.csv"), buffer.getvalue())
+
+        table = Table(title=f"运行指标（总耗时 {snapshot['wall_time']:.1f} 秒）")
+        for column in ("指标", "次数", "总耗时 (s)", "平均 (s)", "最长 (s)", "错误"):
+            table.add_column(column, justify="left" if column == "指标" else "right")
+        for row in rows[1:]:
+            if row[0] == "stage":
+                table.add_row(*map(str, row[1:]))
+        for name, value in sorted(snapshot['counters'].items()):
+            table.add_row(name, str(value), "", "", "", "")
+        console.print(table)
+        return snapshot
+
+
+class FixtureRecorder:
+    """ 将问卷系统和云盘的响应录制为离线夹具，供 `mock_server.MockServer` 回放。
+
+    启用后，录制内容按类型保存在 _fixture_dir_ 下：
+    ```
+    {fixture_dir}/
+        validate/{questionnaire}.json   validate 接口的响应体
+        query/{questionnaire}.json      query 接口的响应体
+        search/{date}[_{date_to}][_p{page}].json    search 接口的响应体，每页一个文件
+        upload_file/{file_name}         上传附件的内容
+        cloud/{token}.json              共享链接的类型和文件列表（含文件大小）
+    ```
+    云盘中的视频文件体积较大，只记录文件列表和大小，回放时按大小生成内容。未启用时各方法不做任何操作。
+    """
+
+    def __init__(self):
+        self.fixture_dir = None
+
+    def start(self, fixture_dir: str):
+        self.fixture_dir = fixture_dir
+        logging.info(f"录制离线夹具：\n- fixture dir: {fixture_dir}")
+
+    def stop(self):
+        self.fixture_dir = None
+
+    def _path(self, kind: str, name: str) -> str:
+        return os.path.join(self.fixture_dir, kind, quote(str(name), safe=""))
+
+    def record_json(self, kind: str, name: str, body):
+        """ 将响应体 _body_ 保存为 `{kind}/{name}.json`。"""
+        if not self.fixture_dir:
+            return
+        try:
+            _atomic_write(self._path(kind, name) + ".json", json.dumps(body, ensure_ascii=False, indent=2))
+        except (OSError, TypeError) as e:
+            logging.warning(f"录制夹具失败：\n- kind: {kind}\n- name: {name}\n- error: {e}")
+
+    def record_file(self, kind: str, name: str, file_path: str):
+        """ 将已保存的文件 _file_path_ 复制为 `{kind}/{name}`。"""
+        if not self.fixture_dir:
+            return
+        try:
+            os.makedirs(os.path.join(self.fixture_dir, kind), exist_ok=True)
+            shutil.copyfile(file_path, self._path(kind, name))
+        except OSError as e:
+            logging.warning(f"录制夹具失败：\n- kind: {kind}\n- name: {name}\n- error: {e}")
+
+
+class AdaptiveWaits:
+    """ 等待具体的页面元素或网络请求出现，超时时间根据观测到的耗时自动调整。
+
+    每类等待（如 `search`、`upload_file`）分别记录最近 _window_ 次成功等待的耗时，超时时间取其中最大值的 _factor_ 倍，
+    并限制在 [_minimum_, _timeout_] 之间；样本不足 3 个时使用 _timeout_。未等到时重新触发并以加倍的超时重试，
+    最多重试 _retries_ 次，因此偶发丢失的事件只需付出一个较短的超时。每次等待的耗时计入 `metrics` 的 `wait_{name}` 阶段。
+
+    Args:
+        timeout (float, optional): 初始及最长超时时间（秒），默认为 10
+        minimum (float, optional): 最短超时时间（秒），默认为 1
+        factor (float, optional): 超时时间相对于观测耗时的倍数，默认为 3
+        retries (int, optional): 未等到时的最大重试次数，默认为 2
+        window (int, optional): 每类等待保留的耗时样本数，默认为 50
+    """
+
+    def __init__(self, timeout: float = 10, minimum: float = 1, factor: float = 3, retries: int = 2, window: int = 50):
+        self.lock = threading.Lock()
+        self.samples = {}   # { name: deque([耗时, ...]), ... }
+        self.configure(timeout, minimum, factor, retries, window)
+
+    def configure(self, timeout: float = 10, minimum: float = 1, factor: float = 3, retries: int = 2, window: int = 50):
+        """ 更新等待参数，已观测的耗时保留。"""
+        with self.lock:
+            self.max_timeout = max(timeout, minimum)
+            self.minimum = minimum
+            self.factor = factor
+            self.retries = max(0, retries)
+            self.window = window
+            self.samples = {name: collections.deque(samples, maxlen=window) for name, samples in self.samples.items()}
+
+    def timeout(self, name: str) -> float:
+        """ 返回等待 _name_ 的当前超时时间（秒）。"""
+        with self.lock:
+            samples = self.samples.get(name)
+            if not samples or len(samples) < 3:
+                return self.max_timeout
+            return min(self.max_timeout, max(self.minimum, self.factor * max(samples)))
+
+    def observe(self, name: str, elapsed: float):
+        """ 记录一次成功等待 _name_ 的耗时。"""
+        with self.lock:
+            self.samples.setdefault(name, collections.deque(maxlen=self.window)).append(elapsed)
+
+    def wait(self, name: str, condition, trigger=None, raise_err: bool = True):
+        """ 调用 _trigger_（可为空）后等待 _condition_ 成立，未成立时重新触发并加倍超时重试。
+
+        Args:
+            name (str): 等待的名称，用于区分耗时统计
+            condition (Callable[[float], Any]): 以超时时间为参数的等待函数，成立时返回真值，超时返回假值
+            trigger (Callable[[], Any], optional): 触发事件的操作，如点击按钮；每次尝试前调用
+            raise_err (bool, optional): 全部尝试都未成立时是否抛出 `TimeoutError`，默认为 True；否则返回最后一次的结果
+
+        Returns:
+            result (Any): _condition_ 返回的真值
+        """
+        timeout = self.timeout(name)
+        for attempt in range(self.retries + 1):
+            if trigger is not None:
+                trigger()
+            start = time.perf_counter()
+            with metrics.timer(f"wait_{name}"):
+                result = condition(timeout)
+            if result:
+                self.observe(name, time.perf_counter() - start)
+                return result
+            metrics.count("wait_misses")
+            if attempt < self.retries:
+                logging.warning(f"等待超时，将重试：\n- wait: {name}\n- timeout: {timeout:.1f}s\n- attempt: {attempt + 1}/{self.retries + 1}")
+                timeout = min(timeout * 2, self.max_timeout)
+        if raise_err:
+            raise TimeoutError(f"等待超时：\n- wait: {name}\n- attempts: {self.retries + 1}")
+        return result
+
+
+def _ele_closed(ele, timeout: float) -> bool:
+    """ 等待元素隐藏或被移除。"""
+    try:
+        return ele.wait.hidden(timeout=timeout, raise_err=False)
+    except ElementLostError:
+        return True
+
+
+class FieldMap:
+    """ 绑定到一条预约问题列表的字段视图，由 `FieldSchema.bind` 创建，按字段名而非问题序号访问问题。
+
+    Args:
+        questions (list): 问卷问题列表
+        indexes (dict): 字段名到问题序号的映射，由 `FieldSchema.compile` 给出
+    """
+
+    __slots__ = ("questions", "indexes")
+
+    def __init__(self, questions: list, indexes: dict):
+        self.questions = questions
+        self.indexes = indexes
+
+    def __getitem__(self, name: str) -> dict:
+        """ 返回字段 _name_ 对应的问题字典；问卷中没有该字段时返回空回答。"""
+        index = self.indexes.get(name)
+        return self.questions[index] if index is not None else {"answer": ""}
+
+    def answer(self, name: str) -> str:
+        """ 返回字段 _name_ 的回答文本。"""
+        return self[name].get('answer') or ""
+
+    def label(self, name: str) -> str:
+        """ 返回字段 _name_ 的问题编号（如 "Q8"），用于日志。"""
+        index = self.indexes.get(name)
+        return f"Q{index + 1}" if index is not None else name
+
+
+class FieldSchema:
+    """ 声明式的字段映射：按问题 ID 或问题文本把问卷中的问题匹配到字段名，供附件识别、下载和报告渲染使用。
+
+    每个字段的匹配规则可包含：
+    + _id_：问题 ID，与问题字典的 _id_ 字段相等时匹配；
+    + _title_：正则表达式，在问题文本 _title_ 中搜索，取第一个匹配的问题；
+    + _index_：以上均未匹配时使用的问题序号（从 0 开始）。
+
+    自定义规则按字段合并到 `DEFAULT_FIELDS` 上，将 _index_ 设为 null 可取消按序号回退。同一问题列表结构（问题 ID 和文本）
+    只编译一次，得到字段名到问题序号的映射，此后按结构缓存，因此不同问卷的数据可混合处理。
+
+    Args:
+        rules (dict | str, optional): 自定义匹配规则 `{ 字段名: {"id": ..., "title": ..., "index": ...}, ... }`，或其 JSON 文件路径；默认为空
+    """
+
+    def __init__(self, rules=None):
+        self.lock = threading.Lock()
+        self.configure(rules)
+
+    def configure(self, rules=None):
+        """ 更新匹配规则并清空已编译的映射。"""
+        if isinstance(rules, str):
+            with open(rules, "r", encoding="utf-8") as f:
+                rules = json.load(f)
+        merged = copy.deepcopy(DEFAULT_FIELDS)
+        for name, rule in (rules or {}).items():
+            merged[name] = {**merged.get(name, {}), **rule}
+        with self.lock:
+            self.rules = {name: {**rule, "title": re.compile(rule['title']) if rule.get('title') else None}
+                          for name, rule in merged.items()}
+            self.compiled = {}  # { 问题列表结构: { 字段名: 问题序号, ... }, ... }
+
+    @staticmethod
+    def _layout(questions: list) -> tuple:
+        return tuple((question.get('id'), question.get('title')) for question in questions)
+
+    def compile(self, questions: list) -> dict:
+        """ 将匹配规则编译为 _questions_ 所属结构下字段名到问题序号的映射，未匹配的字段不在其中。
+
+        Raises:
+            ValueError: 必需字段 `REQUIRED_FIELDS` 未能匹配
+        """
+        layout = self._layout(questions)
+        with self.lock:
+            indexes = self.compiled.get(layout)
+        if indexes is not None:
+            return indexes
+        indexes = {}
+        for name, rule in self.rules.items():
+            for index, (question_id, title) in enumerate(layout):
+                if (rule.get('id') is not None and question_id == rule['id']) or \
+                        (rule['title'] is not None and title and rule['title'].search(title)):
+                    indexes[name] = index
+                    break
+            else:
+                if rule.get('index') is not None and rule['index'] < len(layout):
+                    indexes[name] = rule['index']
+        missing = [name for name in REQUIRED_FIELDS if name not in indexes]
+        if missing:
+            raise ValueError(f"问卷中缺少必需的字段：{', '.join(missing)}")
+        logging.debug("字段映射：\n- " + "\n- ".join(f"{name}: Q{index + 1} {layout[index][1]}" for name, index in indexes.items()))
+        with self.lock:
+            self.compiled[layout] = indexes
+        return indexes
+
+    def bind(self, questions: list) -> FieldMap:
+        """ 返回绑定到 _questions_ 的字段视图。"""
+        return FieldMap(questions, self.compile(questions))
+
+
+metrics = Metrics()
+recorder = FixtureRecorder()
+waits = AdaptiveWaits()
+schema = FieldSchema()
+
+
+def capture_request(res) -> dict:
+    """ 将监听到的网络请求整理为可直接重放的请求模板。
+
+    模板中保留请求方法、不含查询字符串的 URL、查询参数、请求体和请求头，供 `QuestionnaireClient` 在不经过浏览器的情况下重放请求。
+    请求头中的 `Cookie`、`Content-Length`、`Host` 以及 HTTP/2 伪首部由 `requests` 自行生成，不予保留。
+
+    Args:
+        res (DataPacket): `page.listen.wait()` 返回的数据包
+
+    Returns:
+        template (dict): 请求模板，包含 _method_、_url_、_params_、_data_、_headers_ 字段
+    """
+    post_data = res.request.postData
+    return {
+        "method": res.request.method,
+        "url": res.request.url.split("?")[0],
+        "params": res.request.params,
+        "data": post_data if post_data else None,
+        "headers": {key: value for key, value in res.request.headers.items()
+                    if not key.startswith(":") and key.lower() not in ("cookie", "content-length", "host")},
+    }
+
+
+@metrics.timed("verify_password")
 def verify_password(page: ChromiumPage, questionnaire: str, password: str) -> dict:
+    """ 在浏览器中打开查询首页并完成密码验证，获取后续查询所需的凭据。
+
+    除 _appkey_ 和 _signature_ 外，还会记录验证完成后的 Cookie、浏览器 User-Agent 以及 `validate`、`query` 请求模板，
+    供 `QuestionnaireClient` 直接调用接口使用。
+
+    Args:
+        page (ChromiumPage): 浏览器页面对象
+        questionnaire (str): 问卷查询链接的标识符
+        password (str): 问卷查询的密码
+
+    Returns:
+        credentials (dict): 查询凭据，包含 _appkey_、_signature_、_cookies_、_user_agent_、_templates_ 字段；验证失败时返回空字典
+    """
     url = f"https://wenjuan.tsinghua.edu.cn/setting/result/{questionnaire}/"
-    
+    templates = {}
+
     # 访问查询首页，监听获取 appkey 和 signature
     try:
         # 设置网络请求监听
         page.listen.start(f'sr/api/{questionnaire}/validate/') 
         logging.info(f"打开查询首页...")
         logging.debug(f"- url: {url}")
-        page.get(url)
-        
-        res = page.listen.wait(timeout=10)
+        res = waits.wait("validate", lambda timeout: page.listen.wait(timeout=timeout), trigger=lambda: page.get(url))
         logging.info(f"捕获网络请求: \n- target: sr/api/{questionnaire}/validate/\n- url: {res.url}")
         logging.debug(f"- method: {res.method}\n- status: {res.response.status}")
 
@@ -48,6 +464,8 @@ def verify_password(page: ChromiumPage, questionnaire: str, password: str) -> di
             appkey = res.request.post_data['appkey']
             signature = res.request.post_data.get('signature')
         logging.debug(f"获取到 appkey 和 signature：\n- appkey: {appkey}\n- signature: {signature}")
+        templates['validate'] = capture_request(res)
+        recorder.record_json("validate", questionnaire, res.response.body)
         page.listen.stop()
     
     except Exception as e:
@@ -58,15 +476,15 @@ def verify_password(page: ChromiumPage, questionnaire: str, password: str) -> di
     try:
         # 设置网络请求监听
         page.listen.start(f'sr/api/{questionnaire}/query/')
-        ele_input = page.ele('xpath://input[@placeholder="请输入访问密码"]')
+        ele_input = waits.wait("element", lambda timeout: page.ele('xpath://input[@placeholder="请输入访问密码"]', timeout=timeout))
         ele_input.input(password)
-        ele_button = page.ele('text:验证并查询')
-        ele_button.click()
+        ele_button = waits.wait("element", lambda timeout: page.ele('text:验证并查询', timeout=timeout))
+        res = waits.wait("query", lambda timeout: page.listen.wait(timeout=timeout), trigger=ele_button.click)
         logging.info(f"已输入密码并提交。")
-
-        res = page.listen.wait(timeout=10)
         logging.info(f"捕获网络请求: \n- target: sr/api/{questionnaire}/query/\n- url: {res.url}")
         logging.debug(f"- status: {res.response.status}\n- response: {json.dumps(res.response.body, ensure_ascii=False, indent=2)}")
+        templates['query'] = capture_request(res)
+        recorder.record_json("query", questionnaire, res.response.body)
         page.listen.stop()
         logging.info(f"密码验证完成。")
 
@@ -79,11 +497,31 @@ def verify_password(page: ChromiumPage, questionnaire: str, password: str) -> di
 
     return {
         "appkey": appkey,
-        "signature": signature
+        "signature": signature,
+        "cookies": page.cookies(all_domains=True, all_info=True),
+        "user_agent": page.user_agent,
+        "templates": templates,
     }
 
 
-def get_questionnaire_data(page: ChromiumPage, questionnaire: str, date: str) -> list:
+@metrics.timed("browser_query")
+def get_questionnaire_data(page: ChromiumPage, questionnaire: str, date: str, save_dir: str, templates: dict = None,
+                           index: "SyncIndex" = None) -> list:
+    """ 在浏览器中查询指定日期的预约数据，并通过预览附件获取上传文件内容。
+
+    附件内容在捕获后立即写入对应预约文件夹中的封面文件，预约数据中只保留文件路径 _path_、大小 _size_ 和校验和 _sha256_。
+
+    Args:
+        page (ChromiumPage): 已完成密码验证的浏览器页面对象
+        questionnaire (str): 问卷查询链接的标识符
+        date (str): 查询日期，格式为 "YYYY-MM-DD"
+        save_dir (str): 保存目录路径，附件保存到 `_booking_paths` 给出的封面路径
+        templates (dict, optional): 请求模板字典；若提供，则将捕获到的 `search` 和 `upload_file` 请求模板写入其中，供 `QuestionnaireClient` 使用
+        index (SyncIndex, optional): 增量同步索引；若提供，则跳过未变化的预约和已保存的附件，未变化的预约标记 _unchanged_ 字段
+
+    Returns:
+        result (list): 预约数据列表，每项包含 _seq_、_rid_、_questions_ 等字段
+    """
     url = f"https://wenjuan.tsinghua.edu.cn/setting/result/verify/{questionnaire}"
     page.get(url)
 
@@ -92,7 +530,7 @@ def get_questionnaire_data(page: ChromiumPage, questionnaire: str, date: str) ->
         page.listen.start(f'sr/api/{questionnaire}/search/')
         logging.info(f"监听查询 {date} 预约数据...")
         logging.debug(f"- url: {url}\n- date: {date}")
-        ele_date = page.ele('xpath://input[@placeholder="选择日期"]')
+        ele_date = waits.wait("element", lambda timeout: page.ele('xpath://input[@placeholder="选择日期"]', timeout=timeout))
         ele_date.click()
         ele_date.clear()
         ele_date.input(date)
@@ -100,60 +538,1022 @@ def get_questionnaire_data(page: ChromiumPage, questionnaire: str, date: str) ->
         ele_title = page.ele('tag:h3')
         ele_title.click()   # 点击标题以触发日期选择框的关闭和数据的刷新
         logging.debug("已点击标题以触发日期选择框的关闭和数据的刷新")
-        page.wait(1)        # 等待选择框关闭
-        ele_button = page.ele('xpath://button[contains(., "查询")]')
+        ele_button = waits.wait("element", lambda timeout: page.ele('xpath://button[contains(., "查询")]', timeout=timeout))
         logging.debug(f"选中按钮：{ele_button.html}")
-        ele_button.click()
+        # 等待选择框关闭，查询按钮不再被遮挡
+        waits.wait("picker_closed", lambda timeout: ele_button.wait.clickable(timeout=timeout, raise_err=False), raise_err=False)
+        res = waits.wait("search", lambda timeout: page.listen.wait(timeout=timeout), trigger=ele_button.click)
         logging.debug(f"已点击查询按钮")
+        logging.info(f"捕获网络请求：\n- target: sr/api/{questionnaire}/search/\n- url: {res.url}")
+        logging.debug(f"- method: {res.method}\n- status: {res.response.status}\n- response: {json.dumps(res.response.body, ensure_ascii=False, indent=2)}")
+        if templates is not None and 'search' not in templates:
+            template = capture_request(res)
+            if _template_contains(template, date):
+                templates['search'] = template
+                templates['search_date'] = date
+            else:
+                logging.warning(f"search 请求中找不到查询日期，不保存请求模板，继续使用浏览器查询\n- date: {date}\n- url: {res.url}")
+        recorder.record_json("search", date, res.response.body)
+        page.listen.stop()
+        
+    except Exception as e:
+        if 'res' in locals() and hasattr(res, 'response') and hasattr(res.response, 'body'):
+            logging.exception(f"查询数据出错：\n- url: {url}\n- error: {e}\n- response: {json.dumps(res.response.body, ensure_ascii=False, indent=2)}")
+        else:
+            logging.exception(f"查询数据出错：\n- url: {url}\n- error: {e}\n- response: No response captured.")
+        return []
+
+    # 解析数据
+    result = _parse_search_result(res.response.body, date)
+
+    for item in result:
+        pending_uploads = _pending_uploads(item, index)
+        fields = schema.bind(item['questions'])
+        for role, (_, upload) in UPLOAD_ROLES.items():
+            if role in pending_uploads:
+                # 获取文件链接
+                logging.info(f"正在获取文件链接...\n- respond index: {item['seq']}\n- question: {fields.label(upload)}\n- file_name: {fields.answer(upload)}")
+                page.listen.start(f'wjxt/file/rspd/upload_file/')
+                file_name = fields.answer(upload)
+                ele_preview = page.ele(f'xpath://div[contains(text(), "{file_name}")]/span[@class="preview"]')
+                res_img = waits.wait("upload_file", lambda timeout: page.listen.wait(timeout=timeout),
+                                     trigger=ele_preview.click, raise_err=False)
+                if res_img and res_img.response and res_img.response.status == 200:
+                    logging.info(f"捕获网络请求：\n- target: wjxt/file/rspd/upload_file/\n- url: {res_img.url}")
+                    logging.debug(f"- method: {res_img.method}\n- status: {res_img.response.status}")
+                    fields[upload].update(_save_attachment(
+                        [res_img.response.body], _booking_paths(save_dir, item['seq'], item['questions'])[role]))
+                    recorder.record_file("upload_file", file_name, fields[upload]['path'])
+                    if templates is not None and 'upload_file' not in templates:
+                        template = capture_request(res_img)
+                        if _template_contains(template, file_name):
+                            templates['upload_file'] = template
+                            templates['upload_file_name'] = file_name
+                        else:
+                            logging.warning(f"upload_file 请求中找不到文件名，不保存请求模板，继续使用浏览器获取附件\n- file_name: {file_name}\n- url: {res_img.url}")
+                else:
+                    logging.warning(f"未捕获到文件请求：\n- target: wjxt/file/rspd/upload_file/\n- file_name: {file_name}\n- response: No response captured or non-200 status.")
+                page.listen.stop()
+                ele_close = page.ele('xpath://div[contains(text(), "附件预览")]/button[@aria-label="Close"]')
+                ele_close.click()
+                # 等待预览框关闭，以免遮挡下一个预览按钮
+                waits.wait("preview_closed", lambda timeout: _ele_closed(ele_close, timeout), raise_err=False)
+            else:
+                logging.debug(f"该问题未上传文件或文件已保存：\n- respond index: {item['seq']}\n- question: {fields.label(upload)}\n- answer: {fields.answer(upload)}")
+
+    return result
+
+
+def _pending_uploads(item: dict, index: "SyncIndex" = None) -> list:
+    """ 返回预约中需要获取上传附件的封面列表，封面来源不是“此处上传”的附件不会被使用，无需获取。
+
+    若 _index_ 表明该预约与上次同步时一致，则将其标记为 _unchanged_ 并返回空列表；否则跳过来源未变且已保存的附件。
+    """
+    if index is not None and index.is_unchanged(item):
+        logging.info(f"预约信息未变化，跳过：\n- respond index: {item['seq']}\n- rid: {item['rid']}")
+        item['unchanged'] = True
+        return []
+    pending = []
+    fields = schema.bind(item['questions'])
+    for role, (source, upload) in UPLOAD_ROLES.items():
+        if fields.answer(upload) == '' or fields.answer(source) != "此处上传":
+            continue
+        if index is not None and index.file_ok(item['rid'], role, _cover_source(fields, role),
+                                               _booking_paths(index.save_dir, item['seq'], item['questions'])[role]):
+            continue
+        pending.append(role)
+    return pending
+
+
+def _save_attachment(chunks, file_path: str) -> dict:
+    """ 将附件内容逐块写入 _file_path_，边写边计算校验和。
+
+    先写入同目录下的 `.part` 临时文件，写完后再替换目标文件，中断时不会留下不完整的封面。
+
+    Args:
+        chunks (Iterable[bytes]): 附件内容的数据块
+        file_path (str): 保存路径
+
+    Returns:
+        info (dict): 包含保存路径 _path_、文件大小 _size_ 和校验和 _sha256_ 的字典
+    """
+    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+    temp_path = file_path + ".part"
+    digest = hashlib.sha256()
+    size = 0
+    with open(temp_path, "wb") as f:
+        for chunk in chunks:
+            f.write(chunk)
+            digest.update(chunk)
+            size += len(chunk)
+    os.replace(temp_path, file_path)
+    metrics.count("attachments")
+    metrics.count("attachment_bytes", size)
+    return {"path": file_path, "size": size, "sha256": digest.hexdigest()}
+
+
+def _parse_search_result(body: dict, date: str) -> list:
+    """ 从 `search` 接口的响应体中取出预约数据列表。"""
+    if not isinstance(body, dict) or 'data' not in body or body['data'].get('totalCount', 0) == 0:
+        logging.warning(f"未查询到 {date} 数据。")
+        logging.debug(f"- date: {date}\n- totalCount: {body.get('data', {}).get('totalCount', 0) if isinstance(body, dict) else 0}")
+        return []
+
+    result = body['data']['query_result']
+    logging.info(f"查询到数据：\n- date: {date}\n- totalCount: {body['data']['totalCount']}")
+    try:
+        # 按问题列表结构编译字段映射，此后各处直接按字段名取回答
+        for item in result:
+            schema.compile(item['questions'])
+    except ValueError as e:
+        logging.error(f"字段映射失败，请检查 field_schema 配置：\n- date: {date}\n- error: {e}")
+        return []
+    if body['data']['totalCount'] > len(result):
+        logging.warning(f"查询结果只包含第一页，其余数据被截断，可启用接口模式以分页获取\n- date: {date}\n- totalCount: {body['data']['totalCount']}\n- fetched: {len(result)}")
+    logging.debug(f"- data: {json.dumps(result, ensure_ascii=False, indent=2)}")
+    return result
+
+
+def _substitute(value, old: str, new: str):
+    """ 递归地将请求模板中出现的字符串 _old_ 替换为 _new_。"""
+    if isinstance(value, str):
+        return value.replace(old, new)
+    if isinstance(value, dict):
+        return {key: _substitute(item, old, new) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_substitute(item, old, new) for item in value]
+    return value
+
+
+class RateLimiter:
+    """ 按主机限制请求速率，供并发查询的各个工作线程共享。
+
+    每台主机的请求按固定间隔依次排队，同一时刻发起的请求会被错开，而不是一起涌向服务器。
+
+    Args:
+        rate (float): 每台主机每秒允许的最大请求数；不大于 0 时不限速
+    """
+
+    def __init__(self, rate: float):
+        self.interval = 1 / rate if rate and rate > 0 else 0
+        self.lock = threading.Lock()
+        self.next_time = {}     # { host: 下一个可用的发起时刻, ... }
+
+    def wait(self, url: str):
+        """ 阻塞直到允许向 _url_ 所在主机发起请求。"""
+        if not self.interval:
+            return
+        host = urlparse(url).netloc
+        with self.lock:
+            now = time.monotonic()
+            start = max(now, self.next_time.get(host, now))
+            self.next_time[host] = start + self.interval
+        if start > now:
+            time.sleep(start - now)
+
+
+class TabPool:
+    """ 浏览器标签页池，并发查询时每个工作线程独占一个标签页，用完后归还。
+
+    Args:
+        tabs (list): 已完成密码验证的标签页对象列表
+    """
+
+    def __init__(self, tabs: list):
+        self.tabs = list(tabs)
+        self.queue = queue.Queue()
+        for tab in self.tabs:
+            self.queue.put(tab)
+
+    @contextmanager
+    def tab(self):
+        tab = self.queue.get()
+        try:
+            yield tab
+        finally:
+            self.queue.put(tab)
+
+
+def create_tab_pool(page: ChromiumPage, questionnaire: str, password: str, size: int, isolated: bool = False) -> TabPool:
+    """ 以 _page_ 为第一个标签页，再准备 `size - 1` 个标签页并分别完成密码验证，组成标签页池。
+
+    复用浏览器中已打开的其他标签页（如保留的浏览器中上次运行留下的标签页），不足时再新建。
+    验证失败的标签页会被关闭并舍弃，因此标签页池的实际大小可能小于 _size_。
+    浏览器由多个问卷共享时（_isolated_ 为真），不复用其他标签页，新标签页各自使用独立的浏览器上下文。
+
+    Args:
+        page (ChromiumPage): 已完成密码验证的浏览器页面对象
+        questionnaire (str): 问卷查询链接的标识符
+        password (str): 问卷查询的密码
+        size (int): 标签页池大小
+        isolated (bool, optional): 是否与其他问卷共享浏览器，默认为 False
+
+    Returns:
+        pool (TabPool): 标签页池
+    """
+    tabs = [page]
+    count = max(0, size - 1)
+    new_tabs = [tab for tab in page.browser.get_tabs() if tab.tab_id != page.tab_id][:count] if count and not isolated else []
+    new_tabs += [page.browser.new_tab(new_context=isolated) for _ in range(count - len(new_tabs))]
+    if new_tabs:
+        with ThreadPoolExecutor(max_workers=len(new_tabs)) as executor:
+            verified = list(executor.map(lambda tab: verify_password(tab, questionnaire, password), new_tabs))
+        for tab, credentials in zip(new_tabs, verified):
+            if credentials:
+                tabs.append(tab)
+            else:
+                logging.warning(f"标签页密码验证失败，已关闭该标签页\n- tab id: {tab.tab_id}")
+                tab.close()
+    logging.info(f"标签页池已就绪：\n- size: {len(tabs)}")
+    return TabPool(tabs)
+
+
+def fetch_dates(dates: list, fetch, max_workers: int = 4, executor: ThreadPoolExecutor = None) -> list:
+    """ 使用线程池并发查询多个日期的预约数据，并按日期、预约序号的顺序合并结果。
+
+    Args:
+        dates (list): 查询日期列表，格式为 "YYYY-MM-DD"，合并结果按此列表的顺序排列
+        fetch (Callable[[str], list]): 查询单个日期的函数，返回该日期的预约数据列表
+        max_workers (int, optional): 最大并发数，默认为 4
+        executor (ThreadPoolExecutor, optional): 共享的线程池；提供时忽略 _max_workers_，查询提交到该线程池，与其他问卷的查询共用并发额度
+
+    Returns:
+        result (list): 合并后的预约数据列表
+    """
+    results = {}    # { date: [item, ...], ... }
+    own_executor = executor is None
+    if own_executor:
+        executor = ThreadPoolExecutor(max_workers=max(1, max_workers))
+    try:
+        futures = {executor.submit(fetch, date): date for date in dates}
+        for future in as_completed(futures):
+            date = futures[future]
+            try:
+                results[date] = future.result()
+            except Exception as e:
+                logging.exception(f"查询数据出错：\n- date: {date}\n- error: {e}")
+                results[date] = []
+    finally:
+        if own_executor:
+            executor.shutdown()
+
+    result = []
+    for date in dates:
+        result.extend(sorted(results[date], key=lambda item: item['seq']))
+    return result
+
+
+class SessionExpiredError(Exception):
+    """ 服务器拒绝了当前凭据（HTTP 401/403），需要重新完成密码验证。"""
+
+
+class BrowserHost:
+    """ 浏览器实例，首次需要时才启动（或接管）。批量模式中多个问卷的会话共享同一个实例，各自使用独立的标签页。
+
+    指定 _profile_dir_ 时使用该用户数据目录，登录状态随目录保留；指定 _browser_port_ 时优先接管该端口上已运行的浏览器，
+    配合 _keep_browser_ 可让浏览器在多次运行之间常驻。
+
+    Args:
+        profile_dir (str, optional): 浏览器用户数据目录；为空时使用 DrissionPage 的默认配置
+        browser_port (int, optional): 浏览器调试端口；为空时使用 DrissionPage 的默认端口
+        keep_browser (bool, optional): 结束时是否保留浏览器及其标签页，默认为 False
+    """
+
+    def __init__(self, profile_dir: str = None, browser_port: int = None, keep_browser: bool = False):
+        self.profile_dir = profile_dir
+        self.browser_port = browser_port
+        self.keep_browser = keep_browser
+        self.lock = threading.Lock()
+        self.claimed = False    # 主页面是否已分配给某个会话
+        self._page = None
+
+    @property
+    def page(self) -> ChromiumPage:
+        """ 浏览器主页面对象，首次访问时启动（或接管）浏览器。"""
+        with self.lock:
+            if self._page is None:
+                co = ChromiumOptions()
+                co.headless()
+                co.remove_argument('--proxy-server')
+                co.set_argument('--no-proxy-server')
+                if self.profile_dir:
+                    co.set_user_data_path(self.profile_dir)
+                if self.browser_port:
+                    co.set_local_port(self.browser_port)
+                self._page = ChromiumPage(addr_or_opts=co)
+                logging.info(f"浏览器已就绪：\n- address: {self._page.address}")
+            return self._page
+
+    def new_tab(self):
+        """ 为一个会话分配页面：第一个会话使用主页面，之后的会话各自使用新的浏览器上下文中的标签页，Cookie 互不干扰。"""
+        page = self.page
+        with self.lock:
+            if not self.claimed:
+                self.claimed = True
+                return page
+        return page.browser.new_tab(new_context=True)
+
+    def close(self):
+        """ 未要求保留浏览器时关闭浏览器。"""
+        if self._page is not None and not self.keep_browser:
+            self._page.quit()
+
+
+class SessionManager:
+    """ 跨运行复用的查询会话，管理浏览器实例和查询凭据。
+
+    凭据（_appkey_、_signature_、Cookie、User-Agent 和已捕获的请求模板）按问卷标识符缓存在 _cache_path_ 中，
+    并记录过期时刻，取 Cookie 中最早的过期时刻与 `session_ttl` 秒后二者的较小值。未过期的缓存凭据直接使用，
+    不必启动浏览器；只有缓存缺失、过期，或服务器拒绝凭据时才打开浏览器重新验证。密码不会写入缓存。
+
+    浏览器在首次需要时才启动，由 `BrowserHost` 管理；提供 _browser_ 时与其他会话共享该浏览器，只占用其中的标签页，
+    此时忽略 _profile_dir_、_browser_port_ 和 _keep_browser_。
+
+    Args:
+        questionnaire (str): 问卷查询链接的标识符
+        password (str): 问卷查询的密码
+        cache_path (str, optional): 凭据缓存文件路径；为空时不缓存凭据
+        profile_dir (str, optional): 浏览器用户数据目录；为空时使用 DrissionPage 的默认配置
+        browser_port (int, optional): 浏览器调试端口；为空时使用 DrissionPage 的默认端口
+        keep_browser (bool, optional): 结束时是否保留浏览器及其标签页，默认为 False
+        session_ttl (float, optional): 凭据缓存的最长有效时间（秒），默认为 12 小时
+        browser (BrowserHost, optional): 共享的浏览器实例；默认为空，此时由本会话独占浏览器
+    """
+
+    def __init__(self, questionnaire: str, password: str, cache_path: str = None, profile_dir: str = None,
+                 browser_port: int = None, keep_browser: bool = False, session_ttl: float = 12 * 3600,
+                 browser: BrowserHost = None):
+        self.questionnaire = questionnaire
+        self.password = password
+        self.cache_path = cache_path
+        self.shared = browser is not None
+        self.browser = browser or BrowserHost(profile_dir, browser_port, keep_browser)
+        self.session_ttl = session_ttl
+        self.lock = threading.Lock()
+        self.verified = False   # 浏览器页面是否已完成密码验证
+        self._page = None
+        self._tab_pool = None
+        self._credentials = None
+
+    @property
+    def page(self) -> ChromiumPage:
+        """ 本会话的浏览器页面对象，首次访问时启动（或接管）浏览器；共享浏览器时为分配给本会话的标签页。"""
+        if self._page is None:
+            self._page = self.browser.new_tab()
+        return self._page
+
+    def _load_cache(self) -> dict:
+        if not self.cache_path or not os.path.exists(self.cache_path):
+            return {}
+        try:
+            with open(self.cache_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            logging.warning(f"凭据缓存文件读取失败，将重新验证密码\n- file path: {self.cache_path}\n- error: {e}")
+            return {}
+
+    def credentials(self) -> dict:
+        """ 返回查询凭据：优先使用未过期的缓存凭据，否则在浏览器中验证密码。验证失败时返回空字典。"""
+        with self.lock:
+            if self._credentials is None:
+                entry = self._load_cache().get(self.questionnaire)
+                if entry and entry.get('expires', 0) > time.time():
+                    logging.info(f"使用缓存的查询凭据：\n- questionnaire: {self.questionnaire}\n- expires: {datetime.datetime.fromtimestamp(entry['expires'])}")
+                    self._credentials = entry['credentials']
+            if self._credentials is None:
+                return self._verify()
+            return self._credentials
+
+    def reverify(self) -> dict:
+        """ 在浏览器中重新验证密码并就地更新凭据，已捕获的请求模板中的旧 _appkey_、_signature_ 替换为新值。验证失败时返回空字典。"""
+        with self.lock:
+            return self._verify()
+
+    def _verify(self) -> dict:
+        credentials = verify_password(self.page, self.questionnaire, self.password)
+        if not credentials:
+            return {}
+        self.verified = True
+        if self._credentials is None:
+            self._credentials = credentials
+        else:
+            templates = self._credentials.setdefault('templates', {})
+            for key in ('appkey', 'signature'):
+                old, new = self._credentials.get(key), credentials.get(key)
+                if old and new and old != new:
+                    templates.update(_substitute(templates, old, new))
+            templates.update(credentials.pop('templates'))
+            self._credentials.update(credentials)
+        self.save()
+        return self._credentials
+
+    def save(self):
+        """ 将凭据及其过期时刻写入缓存文件，运行中新捕获的请求模板也一并保存。"""
+        if not self.cache_path or not self._credentials:
+            return
+        expires = time.time() + self.session_ttl
+        for cookie in self._credentials.get('cookies', []):
+            if isinstance(cookie.get('expires'), (int, float)) and cookie['expires'] > 0:
+                expires = min(expires, cookie['expires'])
+        cache = self._load_cache()
+        cache[self.questionnaire] = {"expires": expires, "credentials": self._credentials}
+        _atomic_write(self.cache_path, json.dumps(cache, ensure_ascii=False, indent=2))
+
+    def tab_pool(self, size: int) -> TabPool:
+        """ 返回由 _size_ 个已验证标签页组成的标签页池，主页面尚未验证时先完成验证；已创建的标签页池在会话内复用。"""
+        if self._tab_pool is None:
+            if not self.verified:
+                self.reverify()
+            self._tab_pool = create_tab_pool(self.page, self.questionnaire, self.password, size, isolated=self.shared)
+        return self._tab_pool
+
+    def close(self):
+        """ 保存凭据缓存；独占浏览器时按设置关闭浏览器，共享浏览器时由 `BrowserHost` 统一关闭。"""
+        self.save()
+        if not self.shared:
+            self.browser.close()
+        elif self._page is not None and self._page is not self.browser.page and not self.browser.keep_browser:
+            self._page.close()
+
+
+def _template_fields(template: dict) -> list:
+    """ 列出请求模板的查询参数和请求体中的全部字段，返回 `(所在字典, 字段名)` 列表，按出现顺序排列。"""
+    fields = []
+
+    def walk(value):
+        if isinstance(value, dict):
+            for key, item in value.items():
+                if isinstance(item, (dict, list)):
+                    walk(item)
+                else:
+                    fields.append((value, key))
+        elif isinstance(value, list):
+            for item in value:
+                walk(item)
+
+    walk(template['params'])
+    walk(template['data'])
+    return fields
+
+
+def _template_contains(template: dict, value: str) -> bool:
+    """ 模板的查询参数或请求体字段中是否出现字符串 _value_，即能否通过替换该字符串重放请求。"""
+    if not value:
+        return False
+    if isinstance(template['data'], str) and value in template['data']:
+        return True
+    return any(isinstance(container[key], str) and value in container[key]
+               for container, key in _template_fields(template))
+
+
+def _set_template_field(template: dict, keys: tuple, value: int) -> bool:
+    """ 将模板中第一个名称属于 _keys_ 的字段设为 _value_，保持原字段的类型（字符串或数字）；找不到时返回 False。"""
+    for container, key in _template_fields(template):
+        if key in keys:
+            container[key] = str(value) if isinstance(container[key], str) else value
+            return True
+    return False
+
+
+class QuestionnaireClient:
+    """ 直接调用问卷系统接口的 HTTP 客户端。
+
+    浏览器仅用于 `verify_password` 获取凭据并捕获请求模板，之后的 `search` 和 `upload_file` 请求都由本客户端通过
+    带连接池的 `requests.Session` 重放，保持长连接，无需再操作页面。
+
+    Args:
+        questionnaire (str): 问卷查询链接的标识符
+        credentials (dict): `verify_password` 返回的查询凭据，其中 _templates_ 至少应包含 `search` 模板
+        pool_size (int, optional): 连接池大小，默认为 8
+        timeout (float, optional): 单次请求超时时间（秒），默认为 10
+        rate_limiter (RateLimiter, optional): 按主机限速的速率限制器，默认不限速
+        page_size (int, optional): 分页查询时每页的条数，仅在 `search` 模板中有每页条数字段时生效，默认为 100
+        max_workers (int, optional): 并发获取后续分页的最大线程数，默认为 4
+        reauthenticate (Callable[[], dict], optional): 服务器拒绝凭据时调用，重新验证密码并返回新凭据（如 `SessionManager.reverify`）；
+            为空时直接抛出 `SessionExpiredError`
+        executor (ThreadPoolExecutor, optional): 批量模式中共享的查询线程池，后续分页也提交到其中；默认为空，此时为每次分页查询新建线程池
+    """
+
+    def __init__(self, questionnaire: str, credentials: dict, pool_size: int = 8, timeout: float = 10,
+                 rate_limiter: RateLimiter = None, page_size: int = 100, max_workers: int = 4,
+                 reauthenticate=None, executor: ThreadPoolExecutor = None):
+        self.questionnaire = questionnaire
+        self.credentials = credentials
+        self.templates = credentials.setdefault('templates', {})
+        self.timeout = timeout
+        self.rate_limiter = rate_limiter
+        self.page_size = page_size
+        self.max_workers = max_workers
+        self.executor = executor
+        self.browser_lock = threading.Lock()    # 回退到浏览器查询时独占页面
+        self.reauthenticate = reauthenticate
+        self.auth_lock = threading.Lock()
+        self.generation = 0                     # 凭据更新次数，避免多个线程重复验证
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size,
+                              max_retries=Retry(total=3, backoff_factor=0.5, status_forcelist=(502, 503, 504)))
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.update_credentials(credentials)
+
+    def update_credentials(self, credentials: dict):
+        """ 用 _credentials_ 中的 Cookie 和 User-Agent 替换会话中的旧值。"""
+        if credentials.get('user_agent'):
+            self.session.headers['User-Agent'] = credentials['user_agent']
+        self.session.cookies.clear()
+        for cookie in credentials.get('cookies', []):
+            self.session.cookies.set(cookie['name'], cookie['value'],
+                                     domain=cookie.get('domain', ''), path=cookie.get('path', '/'))
+
+    def can_search(self) -> bool:
+        return 'search' in self.templates and _template_contains(self.templates['search'], self.templates.get('search_date'))
+
+    def can_fetch_file(self) -> bool:
+        return 'upload_file' in self.templates and _template_contains(self.templates['upload_file'],
+                                                                       self.templates.get('upload_file_name'))
+
+    def can_paginate(self) -> bool:
+        """ `search` 模板中是否有页码字段。"""
+        return any(key in PAGE_KEYS for _, key in _template_fields(self.templates['search']))
+
+    def supports_range(self) -> bool:
+        """ `search` 模板中是否恰有起止两个日期字段，即能否一次查询一个日期范围。"""
+        return sum(value == self.templates['search_date'] for value in
+                   (container[key] for container, key in _template_fields(self.templates['search']))) == 2
+
+    def _request(self, template: dict, old: str, new: str, **kwargs) -> requests.Response:
+        """ 将模板中的 _old_ 替换为 _new_ 后发送请求。"""
+        return self._send(_substitute(template, old, new), **kwargs)
+
+    def _send(self, template: dict, **kwargs) -> requests.Response:
+        """ 按模板发送请求。"""
+        data = template['data']
+        if self.rate_limiter:
+            self.rate_limiter.wait(template['url'])
+        metrics.count("http_requests")
+        response = self.session.request(
+            template['method'], template['url'],
+            params=template['params'],
+            json=data if isinstance(data, (dict, list)) else None,
+            data=data if isinstance(data, str) else None,
+            headers=template['headers'],
+            timeout=self.timeout,
+            **kwargs
+        )
+        if response.status_code in (401, 403):
+            response.close()
+            raise SessionExpiredError(f"{response.status_code} {response.reason}: {response.url}")
+        response.raise_for_status()
+        return response
+
+    def _authorized(self, action):
+        """ 执行 _action_；服务器拒绝凭据时重新验证密码（多个线程同时遇到时只验证一次），再重试一次。"""
+        generation = self.generation
+        try:
+            return action()
+        except SessionExpiredError as e:
+            if self.reauthenticate is None:
+                raise
+            with self.auth_lock, self.browser_lock:
+                if self.generation == generation:
+                    logging.warning(f"服务器拒绝了当前凭据，重新验证密码\n- error: {e}")
+                    credentials = self.reauthenticate()
+                    if not credentials:
+                        raise
+                    self.update_credentials(credentials)
+                    self.generation += 1
+                    metrics.count("reauthentications")
+            return action()
+
+    def search(self, date: str, date_to: str = None, page: int = None) -> dict:
+        """ 查询指定日期（或日期范围）的一页预约数据，返回 `search` 接口的响应体。
+
+        Args:
+            date (str): 查询日期，格式为 "YYYY-MM-DD"；提供 _date_to_ 时为起始日期
+            date_to (str, optional): 结束日期（含），仅在 `supports_range()` 为真时可用
+            page (int, optional): 页码；默认为空，此时沿用模板中的页码
+        """
+        return self._authorized(lambda: self._search(date, date_to, page))
+
+    def _search(self, date: str, date_to: str = None, page: int = None) -> dict:
+        template = copy.deepcopy(self.templates['search'])
+        if date_to is None:
+            template = _substitute(template, self.templates['search_date'], date)
+        else:
+            # 模板中的两个日期字段依次为起始日期和结束日期
+            date_fields = [(container, key) for container, key in _template_fields(template)
+                           if container[key] == self.templates['search_date']]
+            for (container, key), value in zip(date_fields, (date, date_to)):
+                container[key] = value
+        if page is not None:
+            _set_template_field(template, PAGE_KEYS, page)
+            _set_template_field(template, PAGE_SIZE_KEYS, self.page_size)
+        with metrics.timer("api_search"):
+            response = self._send(template)
+        logging.info(f"接口查询完成：\n- url: {response.url}\n- status: {response.status_code}\n- page: {page}")
+        body = response.json()
+        recorder.record_json("search", "_".join([date] + ([date_to] if date_to else []) + ([f"p{page}"] if page is not None else [])), body)
+        return body
+
+    def search_all(self, date: str, date_to: str = None) -> dict:
+        """ 分页查询指定日期（或日期范围）的全部预约数据，合并为一个响应体。
+
+        先请求第一页，根据 _totalCount_ 和第一页实际返回的条数计算总页数，再以 _max_workers_ 个线程并发请求其余各页；
+        按页码顺序合并 _query_result_，并按预约 ID 去重。模板中没有页码字段时只能取得第一页，结果被截断时给出警告。
+        """
+        first_page = None
+        if self.can_paginate():
+            first_page = next(int(container[key]) for container, key in _template_fields(self.templates['search'])
+                              if key in PAGE_KEYS)
+        body = self.search(date, date_to, first_page)
+        data = body.get('data') if isinstance(body, dict) else None
+        if not data or not data.get('query_result'):
+            return body
+        total, fetched = data.get('totalCount', 0), len(data['query_result'])
+        if total <= fetched:
+            return body
+        if first_page is None:
+            logging.warning(f"search 请求模板中没有页码字段，无法分页，结果被截断\n- date: {date}\n- totalCount: {total}\n- fetched: {fetched}")
+            return body
+
+        pages = range(first_page + 1, first_page + math.ceil(total / fetched))
+        logging.info(f"分页获取其余数据：\n- date: {date}\n- totalCount: {total}\n- pages: {len(pages) + 1}")
+        bodies = self._search_pages(date, date_to, pages)
+        result = {item['rid']: item for item in data['query_result']}
+        for page_body in bodies:
+            for item in page_body.get('data', {}).get('query_result', []):
+                result.setdefault(item['rid'], item)
+        data['query_result'] = list(result.values())
+        if len(result) < total:
+            logging.warning(f"分页获取的条数少于 totalCount，数据可能在查询期间发生变化\n- date: {date}\n- totalCount: {total}\n- fetched: {len(result)}")
+        return body
+
+    def _search_pages(self, date: str, date_to: str, pages: range) -> list:
+        """ 并发请求 _pages_ 中的各页，按页码顺序返回响应体。
+
+        提供了共享线程池时，调用线程（通常本身就是共享线程池的工作线程）与提交到共享线程池的辅助任务从同一页码队列中领取页码，
+        调用线程也参与请求，最后只等待已被领取的页完成；尚未开始的辅助任务领取不到页码时直接结束，不会占住工作线程互相等待。
+        """
+        if self.executor is None:
+            with ThreadPoolExecutor(max_workers=max(1, self.max_workers)) as executor:
+                return list(executor.map(lambda page: self.search(date, date_to, page), pages))
+
+        bodies = [None] * len(pages)
+        remaining = iter(enumerate(pages))
+        state = {"claimed": 0, "done": 0, "error": None}
+        condition = threading.Condition()
+
+        def work():
+            while True:
+                with condition:
+                    claimed = next(remaining, None) if state['error'] is None else None
+                    if claimed is None:
+                        return
+                    state['claimed'] += 1
+                position, page = claimed
+                try:
+                    body, error = self.search(date, date_to, page), None
+                except Exception as e:
+                    body, error = None, e
+                with condition:
+                    bodies[position] = body
+                    state['error'] = state['error'] or error
+                    state['done'] += 1
+                    condition.notify_all()
+
+        for _ in range(min(max(1, self.max_workers), len(pages)) - 1):
+            self.executor.submit(work)
+        work()
+        with condition:
+            condition.wait_for(lambda: state['done'] == state['claimed'])
+        if state['error'] is not None:
+            raise state['error']
+        return bodies
+
+    def fetch_file(self, file_name: str, file_path: str, chunk_size: int = 1 << 16) -> dict:
+        """ 以流式请求获取上传附件，分块写入 _file_path_，返回 `_save_attachment` 的结果。"""
+        response = self._authorized(lambda: self._request(self.templates['upload_file'], self.templates['upload_file_name'],
+                                                          file_name, stream=True))
+        with response:
+            info = _save_attachment(response.iter_content(chunk_size=chunk_size), file_path)
+        recorder.record_file("upload_file", file_name, file_path)
+        logging.info(f"接口获取附件完成：\n- url: {response.url}\n- status: {response.status_code}\n- size: {info['size']}")
+        return info
+
+
+def get_questionnaire_data_api(client: QuestionnaireClient, date: str, save_dir: str, page: ChromiumPage = None,
+                               index: "SyncIndex" = None, date_to: str = None) -> list:
+    """ 通过 HTTP 接口分页查询指定日期的预约数据，并直接请求上传附件的内容，以流式方式写入对应的封面文件。
+
+    若当日数据中包含附件，而 _client_ 尚未捕获 `upload_file` 请求模板，则在提供了 _page_ 时回退到
+    `get_questionnaire_data` 在浏览器中完成当日查询，同时捕获该模板；此后的附件均直接通过接口获取。
+    回退查询由 `client.browser_lock` 串行化，可在多个线程中同时调用本函数。
+
+    Args:
+        client (QuestionnaireClient): 接口客户端
+        date (str): 查询日期，格式为 "YYYY-MM-DD"
+        save_dir (str): 保存目录路径，含义同 `get_questionnaire_data`
+        page (ChromiumPage, optional): 已完成密码验证的浏览器页面对象，仅用于捕获缺失的请求模板
+        index (SyncIndex, optional): 增量同步索引，含义同 `get_questionnaire_data`
+        date_to (str, optional): 结束日期（含）；提供时以一次范围查询取代逐日查询，须 `client.supports_range()` 为真，且不再回退到浏览器
+
+    Returns:
+        result (list): 预约数据列表，格式与 `get_questionnaire_data` 相同
+    """
+    label = f"{date} ~ {date_to}" if date_to else date
+    try:
+        result = _parse_search_result(client.search_all(date, date_to), label)
+    except Exception as e:
+        logging.exception(f"接口查询数据出错：\n- date: {label}\n- error: {e}")
+        return []
+
+    pending_uploads = {item['rid']: _pending_uploads(item, index) for item in result}
+    if any(pending_uploads.values()) and not client.can_fetch_file():
+        if page is None or date_to:
+            logging.warning(f"尚未捕获附件请求模板，且无法回退到浏览器查询，将跳过附件获取\n- date: {label}")
+        else:
+            with client.browser_lock:
+                # 等待锁期间其他线程可能已捕获模板
+                if not client.can_fetch_file():
+                    logging.info(f"尚未捕获附件请求模板，回退到浏览器查询\n- date: {date}")
+                    return get_questionnaire_data(page, client.questionnaire, date, save_dir, client.templates, index)
+
+    for item in result:
+        fields = schema.bind(item['questions'])
+        for role in pending_uploads[item['rid']]:
+            upload = UPLOAD_ROLES[role][1]
+            file_name = fields.answer(upload)
+            if not client.can_fetch_file():
+                continue
+            logging.info(f"正在获取文件...\n- respond index: {item['seq']}\n- question: {fields.label(upload)}\n- file_name: {file_name}")
+            try:
+                file_path = _booking_paths(save_dir, item['seq'], item['questions'])[role]
+                with metrics.timer("attachment"):
+                    fields[upload].update(client.fetch_file(file_name, file_path))
+            except Exception as e:
+                logging.exception(f"接口获取附件出错：\n- file_name: {file_name}\n- error: {e}")
+
+    return result
+
+
+def _booking_paths(save_dir: str, seq: int, questions: list) -> dict:
+    """ 计算预约信息文件夹及视频、封面文件的保存路径。
+
+    Returns:
+        paths (dict): 包含 _folder_、_video_、_cover1_、_cover2_ 字段
+    """
+    fields = schema.bind(questions)
+    folder_path = os.path.join(save_dir, f"{seq}_{datetime.datetime.strptime(fields.answer('date'), '%Y-%m-%d').strftime('%Y%m%d')}")
+    short_title = fields.answer('short_title')
+    return {
+        "folder": folder_path,
+        "video": os.path.join(folder_path, f"{seq}-{short_title}.mp4"),
+        "cover1": os.path.join(folder_path, f"{seq}-{short_title}-cover1.jpg"),
+        "cover2": os.path.join(folder_path, f"{seq}-{short_title}-cover2.jpg"),
+    }
+
+
+def _cover_source(fields: FieldMap, role: str) -> str:
+    """ 封面文件的来源标识：来源问题和上传问题的回答，以及视频链接（云盘中的封面随视频一同下载）。"""
+    source, upload = UPLOAD_ROLES[role]
+    return "|".join([fields.answer(source), fields.answer(upload), fields.answer('video_link')])
+
+
+def _cover_roles(fields: FieldMap) -> list:
+    """ 返回需要保存封面文件的封面列表：来源为“此处上传”且上传了附件，或封面已附在云盘链接中。"""
+    return [role for role, (source, upload) in UPLOAD_ROLES.items()
+            if fields.answer(source) == "此处上传" and fields.answer(upload) != ''
+            or fields.answer(source).startswith("已附在云盘链接中")]
+
+
+def _file_checksum(file_path: str, chunk_size: int = 1 << 20) -> str:
+    """ 分块计算文件的 SHA-256 校验和。"""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class SyncIndex:
+    """ 增量同步索引，以 JSON 清单的形式保存在 `{save_dir}/sync_index.json` 中。
+
+    以预约 ID _rid_ 为键，记录每条预约的序号、日期、回答内容的哈希值，以及已保存的视频、封面文件的路径、来源、大小和校验和：
+    ```
+    {
+        "{rid}": {
+            "seq": 12, "date": "2026-02-15", "hash": "...",
+            "files": { "video": { "path": "...", "source": "...", "size": 1024, "sha256": "..." }, ... }
+        },
+        ...
+    }
+    ```
+    再次运行时，回答未变且文件完好的预约整体跳过；回答有变化时，来源未变且文件完好的视频、封面也不再重复获取。
+
+    Args:
+        save_dir (str): 保存目录路径
+    """
+
+    def __init__(self, save_dir: str):
+        self.save_dir = save_dir
+        self.path = os.path.join(save_dir, "sync_index.json")
+        self.lock = threading.Lock()
+        self.entries = {}
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    self.entries = json.load(f)
+            except (OSError, json.JSONDecodeError) as e:
+                logging.warning(f"同步索引文件读取失败，将重新建立索引\n- file path: {self.path}\n- error: {e}")
+
+    @staticmethod
+    def response_hash(questions: list) -> str:
+        """ 计算回答内容的哈希值，只取问题文本和回答文本，忽略获取到的附件内容。"""
+        content = [[question.get('title'), question.get('answer')] for question in questions]
+        return hashlib.sha256(json.dumps(content, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+    def file_ok(self, rid: str, role: str, source: str, path: str) -> bool:
+        """ 判断文件 _role_ 是否已由相同来源保存到 _path_，且文件大小与记录一致。"""
+        with self.lock:
+            record = self.entries.get(rid, {}).get('files', {}).get(role)
+        return (record is not None and record['source'] == source and record['path'] == path
+                and os.path.isfile(path) and os.path.getsize(path) == record['size'])
+
+    def expected_checksum(self, rid: str, role: str, source: str) -> str:
+        """ 返回同一来源的文件上次保存时记录的校验和，用于校验重新下载的文件；没有记录时返回 None。"""
+        with self.lock:
+            record = self.entries.get(rid, {}).get('files', {}).get(role)
+        return record['sha256'] if record is not None and record['source'] == source else None
+
+    def is_unchanged(self, item: dict) -> bool:
+        """ 判断预约的回答内容与上次同步时一致，需要保存的封面都有记录，且记录的文件均完好。"""
+        with self.lock:
+            entry = self.entries.get(item['rid'])
+        if entry is None or entry.get('seq') != item['seq'] or entry.get('hash') != self.response_hash(item['questions']):
+            return False
+        files = entry.get('files', {})
+        if any(role not in files for role in _cover_roles(schema.bind(item['questions']))):
+            return False
+        return all(os.path.isfile(record['path']) and os.path.getsize(record['path']) == record['size']
+                   for record in files.values())
+
+    def record_file(self, rid: str, role: str, source: str, path: str, sha256: str = None):
+        """ 记录已保存的文件及其大小和校验和；未提供 _sha256_ 时读取文件计算。"""
+        record = {"path": path, "source": source, "size": os.path.getsize(path), "sha256": sha256 or _file_checksum(path)}
+        with self.lock:
+            self.entries.setdefault(rid, {}).setdefault('files', {})[role] = record
+
+    def update(self, item: dict):
+        """ 预约的全部文件保存完成后，记录其序号、日期和回答内容的哈希值。"""
+        with self.lock:
+            entry = self.entries.setdefault(item['rid'], {})
+            entry.update({"seq": item['seq'], "date": schema.bind(item['questions']).answer('date'),
+                          "hash": self.response_hash(item['questions'])})
+            entry.setdefault('files', {})
+
+    def save(self):
+        """ 将索引写回文件，先写入临时文件再替换，避免中断时损坏索引。"""
+        with self.lock:
+            _atomic_write(self.path, json.dumps(self.entries, ensure_ascii=False, indent=2))
+
+
+class MediaStore:
+    """ 按内容寻址的媒体文件存储，保存在 `{save_dir}/.media/` 中，同一内容的视频、封面在磁盘上只保存一份。
+
+    文件以 SHA-256 校验和命名保存在 `objects/` 下，预约文件夹中的文件是指向它的硬链接（或符号链接、副本）。
+    清单 `media_index.json` 同时记录共享来源（共享标识、共享内路径或版本标识，以及大小）到校验和的映射：
+    ```
+    {
+        "objects": { "{sha256}": { "path": "objects/ab/{sha256}.mp4", "size": 1024 }, ... },
+        "sources": { "d/{token}/video.mp4|1024": "{sha256}", "f/{token}|1024|{etag}": "{sha256}", ... }
+    }
+    ```
+    下载前若来源已有记录且文件完好，直接链接到目标路径而不再传输，因此重复提交的视频、日期变化后移动的文件夹都不会重新下载；
+    新下载或新保存的文件移入存储，内容已存在时改为链接到已有的文件。
+
+    Args:
+        save_dir (str): 保存目录路径
+        link_mode (str, optional): 链接方式，"hardlink" 或 "symlink"，默认为 "hardlink"；无法创建时依次退回符号链接和复制
+    """
+
+    def __init__(self, save_dir: str, link_mode: str = "hardlink"):
+        self.root = os.path.join(save_dir, ".media")
+        self.path = os.path.join(self.root, "media_index.json")
+        self.link_mode = link_mode
+        self.lock = threading.Lock()
+        self.objects = {}   # { sha256: { "path": 相对路径, "size": 大小 }, ... }
+        self.sources = {}   # { 来源: sha256, ... }
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    manifest = json.load(f)
+                self.objects, self.sources = manifest.get('objects', {}), manifest.get('sources', {})
+            except (OSError, json.JSONDecodeError) as e:
+                logging.warning(f"媒体存储清单读取失败，将重新建立\n- file path: {self.path}\n- error: {e}")
+
+    def _object_path(self, sha256: str) -> str:
+        return os.path.join(self.root, self.objects[sha256]['path'])
 
-        res = page.listen.wait(timeout=10)
-        logging.info(f"捕获网络请求：\n- target: sr/api/{questionnaire}/search/\n- url: {res.url}")
-        logging.debug(f"- method: {res.method}\n- status: {res.response.status}\n- response: {json.dumps(res.response.body, ensure_ascii=False, indent=2)}")
-        page.listen.stop()
-        
-    except Exception as e:
-        if 'res' in locals() and hasattr(res, 'response') and hasattr(res.response, 'body'):
-            logging.exception(f"查询数据出错：\n- url: {url}\n- error: {e}\n- response: {json.dumps(res.response.body, ensure_ascii=False, indent=2)}")
-        else:
-            logging.exception(f"查询数据出错：\n- url: {url}\n- error: {e}\n- response: No response captured.")
-        return []
+    def _intact(self, sha256: str) -> bool:
+        record = self.objects.get(sha256)
+        return record is not None and os.path.isfile(self._object_path(sha256)) \
+            and os.path.getsize(self._object_path(sha256)) == record['size']
 
-    # 解析数据
-    if 'data' not in res.response.body or res.response.body['data'].get('totalCount', 0) == 0:
-        logging.warning(f"未查询到 {date} 数据。")
-        logging.debug(f"- date: {date}\n- totalCount: {res.response.body.get('data', {}).get('totalCount', 0)}")
-        return []
-    
-    result = res.response.body['data']['query_result']
-    logging.info(f"查询到数据：\n- date: {date}\n- totalCount: {res.response.body['data']['totalCount']}")
-    logging.debug(f"- data: {json.dumps(result, ensure_ascii=False, indent=2)}")
+    def _link(self, sha256: str, path: str):
+        """ 将对象链接到 _path_，先在临时路径创建再替换，已是同一文件时不做处理；未能创建硬链接时标记该对象不参与清理。"""
+        target = self._object_path(sha256)
+        if os.path.exists(path) and os.path.samefile(path, target):
+            return
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        temp_path = path + ".link"
+        if os.path.lexists(temp_path):
+            os.remove(temp_path)
+        try:
+            if self.link_mode != "hardlink":
+                raise OSError("symlink mode")
+            os.link(target, temp_path)
+        except OSError:
+            self.objects[sha256]['pinned'] = True
+            try:
+                os.symlink(os.path.abspath(target), temp_path)
+            except OSError as e:
+                logging.debug(f"无法创建链接，将复制文件：\n- file path: {path}\n- error: {e}")
+                shutil.copyfile(target, temp_path)
+        os.replace(temp_path, path)
 
-    for item in result:
-        for upload in [8, 11]:
-            if item['questions'][upload]['answer'] != '':
-                # 获取文件链接
-                logging.info(f"正在获取文件链接...\n- respond index: {item['seq']}\n- question index: {upload}\n- file_name: {item['questions'][upload]['answer']}")
-                page.listen.start(f'wjxt/file/rspd/upload_file/')
-                file_name = item['questions'][upload]['answer']
-                ele_preview = page.ele(f'xpath://div[contains(text(), "{file_name}")]/span[@class="preview"]')
-                ele_preview.click()
-                res_img = page.listen.wait(timeout=10)
-                if res_img and res_img.response and res_img.response.status == 200:
-                    logging.info(f"捕获网络请求：\n- target: wjxt/file/rspd/upload_file/\n- url: {res_img.url}")
-                    logging.debug(f"- method: {res_img.method}\n- status: {res_img.response.status}")
-                    item['questions'][upload]['base64'] = res_img.response.body
-                else:
-                    logging.warning(f"未捕获到文件请求：\n- target: wjxt/file/rspd/upload_file/\n- file_name: {file_name}\n- response: No response captured or non-200 status.")
-                page.listen.stop()
-                ele_close = page.ele('xpath://div[contains(text(), "附件预览")]/button[@aria-label="Close"]')
-                ele_close.click()
+    def fetch(self, source: str, path: str, expected_size: int = None, expected_sha256: str = None) -> dict:
+        """ 若来源 _source_ 已有完好的对象（且大小、校验和符合预期），将其链接到 _path_ 并返回文件信息，否则返回 None。
+
+        Returns:
+            info (dict): 包含路径 _path_、大小 _size_ 和校验和 _sha256_ 的字典
+        """
+        with self.lock:
+            sha256 = self.sources.get(source)
+            if sha256 is None or not self._intact(sha256) or (expected_sha256 and sha256 != expected_sha256) \
+                    or (expected_size is not None and self.objects[sha256]['size'] != expected_size):
+                return None
+            self._link(sha256, path)
+            size = self.objects[sha256]['size']
+        logging.info(f"媒体存储中已有相同来源的文件，跳过下载：\n- source: {source}\n- file path: {path}")
+        metrics.count("media_reused")
+        metrics.count("media_reused_bytes", size)
+        return {"path": path, "size": size, "sha256": sha256}
+
+    def adopt(self, path: str, source: str = None, sha256: str = None) -> dict:
+        """ 将已保存的文件纳入存储：内容已存在时以链接替换 _path_，否则把文件移入存储再链接回来；提供 _source_ 时记录来源。
+
+        Returns:
+            info (dict): 包含路径 _path_、大小 _size_ 和校验和 _sha256_ 的字典
+        """
+        sha256 = sha256 or _file_checksum(path)
+        with self.lock:
+            if self._intact(sha256):
+                if not os.path.samefile(path, self._object_path(sha256)):
+                    logging.info(f"媒体存储中已有相同内容的文件，改为链接：\n- file path: {path}\n- sha256: {sha256}")
+                    metrics.count("media_deduplicated")
+                    self._link(sha256, path)
             else:
-                logging.debug(f"该问题未上传文件：\n- respond index: {item['seq']}\n- question index: {upload}\n- answer: {item['questions'][upload]['answer']}")
+                relative = os.path.join("objects", sha256[:2], sha256 + os.path.splitext(path)[1].lower())
+                self.objects[sha256] = {"path": relative, "size": os.path.getsize(path)}
+                os.makedirs(os.path.dirname(self._object_path(sha256)), exist_ok=True)
+                os.replace(path, self._object_path(sha256))
+                try:
+                    self._link(sha256, path)
+                except OSError:
+                    # 链接失败时把文件移回原处，不影响预约文件夹
+                    os.replace(self._object_path(sha256), path)
+                    del self.objects[sha256]
+                    raise
+            if source:
+                self.sources[source] = sha256
+            size = self.objects[sha256]['size']
+        return {"path": path, "size": size, "sha256": sha256}
 
-    return result
+    def prune(self):
+        """ 以硬链接方式存储时，删除已没有任何预约文件夹引用的对象及其来源记录；以符号链接或副本引用的对象无法判断，予以保留。"""
+        if self.link_mode != "hardlink":
+            return
+        with self.lock:
+            orphans = [sha256 for sha256, record in self.objects.items() if not record.get('pinned') and
+                       (not os.path.isfile(self._object_path(sha256)) or os.stat(self._object_path(sha256)).st_nlink <= 1)]
+            for sha256 in orphans:
+                if os.path.isfile(self._object_path(sha256)):
+                    os.remove(self._object_path(sha256))
+                del self.objects[sha256]
+            self.sources = {source: sha256 for source, sha256 in self.sources.items() if sha256 in self.objects}
+        if orphans:
+            logging.info(f"已清理媒体存储中不再被引用的文件：\n- count: {len(orphans)}")
+
+    def save(self):
+        """ 将清单写回文件，先写入临时文件再替换。"""
+        with self.lock:
+            _atomic_write(self.path, json.dumps({"objects": self.objects, "sources": self.sources}, ensure_ascii=False, indent=2))
 
 
-def dump_booking_info(seq: int, rid: str, questions: list, save_dir: str, downloader_script_dir: str) -> str:
+def dump_booking_info(seq: int, rid: str, questions: list, save_dir: str, downloader_script_dir: str,
+                      scheduler: "DownloadScheduler" = None, index: SyncIndex = None,
+                      store: "BookingStore" = None, media: MediaStore = None) -> str:
     """ 将预约信息保存到本地 Markdown 文件中，将相关文件保存到文件夹。
     
     Markdown 文件内容格式为：
@@ -173,180 +1573,882 @@ def dump_booking_info(seq: int, rid: str, questions: list, save_dir: str, downlo
     ## 2026-02-14
     ```
 
-    若检测到同一预约序号的信息已在本地存在，则覆盖原有信息并更新文件。
+    若检测到同一预约的信息已在本地存在，则覆盖原有信息。
+
+    若提供了 _store_，预约信息只写入该结构化存储，由调用方在全部预约处理完成后调用 `BookingStore.render` 一次性生成 Markdown 文件；
+    否则读取 _save_dir_ 下的存储，写入本条预约后立即保存并重新生成 Markdown 文件。
+
+    若提供了 _scheduler_，视频下载将提交到下载调度器后台进行：预约信息立即写入存储，视频路径暂记为“下载中”，
+    下载完成（或最终失败）后再更新；依赖云盘文件的封面也在此时一并处理。
+
+    若提供了 _index_，来源未变且文件完好的视频、封面不再重复下载；全部文件保存成功后更新该预约的索引记录。
+
+    若提供了 _media_，保存的视频、封面都纳入媒体存储，预约文件夹中只保留链接；其他预约或以往运行中已下载过的共享文件直接链接而不再下载。
 
     Args:
         seq (int): 预约序号
         rid (str): 预约 ID
-        questions (list): 问卷问题列表，每个问题包含问题文本 _title_、回答文本 _answer_；对于上传文件的问题，_answer_ 为文件名，且包含一个 _base64_ 字段表示文件的 Base64 编码内容
+        questions (list): 问卷问题列表，每个问题包含问题文本 _title_、回答文本 _answer_；对于上传文件的问题，_answer_ 为文件名，已获取的附件另含保存路径 _path_、大小 _size_ 和校验和 _sha256_
         save_dir (str): 保存目录路径，文件将保存到该目录下的 `booking_info.md`，相关文件将保存到该目录下的 `{seq}_{%Y%m%d}\\` 文件夹中。
+        downloader_script_dir (str): THU-Cloud-Downloader 脚本所在目录；为空时使用进程内下载器
+        scheduler (DownloadScheduler, optional): 下载调度器；默认为空，此时同步下载视频
+        index (SyncIndex, optional): 增量同步索引；默认为空，此时总是重新下载
+        store (BookingStore, optional): 预约信息存储；默认为空，此时每条预约写入后立即生成 Markdown 文件
+        media (MediaStore, optional): 媒体存储；默认为空，此时文件直接保存在预约文件夹中
 
     Returns:
         file_path (str): 预约信息 Markdown 文件的路径
     """
-    file_path = os.path.join(save_dir, "booking_info.md")
-    folder_path = os.path.join(save_dir, f"{seq}_{datetime.datetime.strptime(questions[1]['answer'], '%Y-%m-%d').strftime('%Y%m%d')}")
-    if os.path.exists(folder_path):
+    own_store = store is None
+    if own_store:
+        store = BookingStore(save_dir)
+    file_path = store.markdown_path
+    paths = _booking_paths(save_dir, seq, questions)
+    fields = schema.bind(questions)
+    folder_path = paths['folder']
+    # 获取附件时已创建的文件夹不必提示
+    if os.path.exists(folder_path) and not any('path' in fields[upload] for _, upload in UPLOAD_ROLES.values()):
         logging.warning(f"信息文件夹已存在，将写入已有文件夹，可能覆盖原有文件\n- folder path: {folder_path}")
     os.makedirs(folder_path, exist_ok=True)
     logging.info(f"正在保存预约信息：\n- seq: {seq}\n- file path: {file_path}\n- folder path: {folder_path}")
-    logging.debug(f"- rid: {rid}\n- questions: {json.dumps(questions, ensure_ascii=False, indent=2, default=lambda x: '<bytes>' if isinstance(x, bytes) else str(x))}")
+    logging.debug(f"- rid: {rid}\n- questions: {json.dumps(questions, ensure_ascii=False, indent=2)}")
+
+    video_link = fields.answer('video_link')
+    video_name = os.path.basename(paths['video'])
+    covers = {}     # { 封面文件: 封面路径或状态文本, ... }
+
+    def save_covers(video_done: bool) -> tuple:
+        # 依赖云盘文件的封面须等视频下载完成后才能处理
+        for role, (source, upload) in UPLOAD_ROLES.items():
+            if covers.get(role, "等待视频下载") != "等待视频下载":
+                continue
+            if index and index.file_ok(rid, role, _cover_source(fields, role), paths[role]):
+                logging.info(f"封面文件未变化，跳过保存\n- seq: {seq}\n- file path: {paths[role]}")
+                covers[role] = paths[role]
+            elif not video_done and fields.answer(source).startswith("已附在云盘链接中"):
+                covers[role] = "等待视频下载"
+            else:
+                covers[role] = _save_cover(seq, fields, role, folder_path, paths[role])
+                if not os.path.isfile(covers[role]):
+                    continue
+                sha256 = fields[upload].get('sha256') if fields.answer(source) == "此处上传" else None
+                if media:
+                    sha256 = media.adopt(covers[role], sha256=sha256)['sha256']
+                if index:
+                    index.record_file(rid, role, _cover_source(fields, role), covers[role], sha256)
+        return covers['cover1'], covers['cover2']
+
+    def finish(video_path: str, sha256: str = None):
+        if media and os.path.isfile(video_path):
+            # 进程内下载器已将视频纳入存储，此处只需处理脚本下载或以往保存的文件
+            sha256 = media.adopt(video_path, sha256=sha256)['sha256']
+        store.put(seq, rid, questions, video_path, *save_covers(video_done=True))
+        if own_store:
+            store.save()
+            store.render()
+        if index and video_path != "下载失败":
+            if os.path.isfile(video_path):
+                index.record_file(rid, 'video', video_link, video_path, sha256)
+            missing = [role for role in _cover_roles(fields) if not os.path.isfile(covers[role])]
+            if missing:
+                # 不记录回答哈希，下次运行时重新获取缺失的封面
+                logging.warning(f"封面文件未全部保存，下次运行将重新获取\n- seq: {seq}\n- covers: {missing}")
+            else:
+                index.update({"seq": seq, "rid": rid, "questions": questions})
+
+    # 随视频上传到云盘文件夹中的封面文件，由进程内下载器一并下载
+    extra_files = tuple(fields.answer(source).split("文件名：:")[-1] for source, _ in UPLOAD_ROLES.values()
+                        if fields.answer(source).startswith("已附在云盘链接中"))
+    expected_sha256 = index.expected_checksum(rid, 'video', video_link) if index else None
+
+    if index and index.file_ok(rid, 'video', video_link, paths['video']):
+        logging.info(f"视频文件未变化，跳过下载\n- seq: {seq}\n- file path: {paths['video']}")
+        finish(paths['video'], expected_sha256)
+        return file_path
+
+    if scheduler is not None:
+        # 先写入预约信息，视频下载完成后再更新
+        store.put(seq, rid, questions, "下载中", *save_covers(video_done=False))
+        scheduler.submit(video_link, folder_path, video_name, finish, extra_files, expected_sha256, group=save_dir, media=media)
+        return file_path
 
     # 保存相关文件
-    video_path = os.path.join(folder_path, f"{seq}-{questions[5]['answer']}.mp4")
+    video_path = paths['video']
+    info = {}
     try:
-        download_from_cloud(questions[3]['answer'], folder_path, f"{seq}-{questions[5]['answer']}.mp4", downloader_script_dir)
+        info = download_from_cloud(video_link, folder_path, video_name, downloader_script_dir,
+                                   extra_files, expected_sha256=expected_sha256, media=media)
     except Exception as e:
-        logging.exception(f"下载视频文件出错：\n- seq: {seq}\n- link: {questions[3]['answer']}\n- error: {e}")
+        logging.exception(f"下载视频文件出错：\n- seq: {seq}\n- link: {video_link}\n- error: {e}")
         video_path = "下载失败"
+    finish(video_path, info.get('sha256'))
 
-    cover1_path = os.path.join(folder_path, f"{seq}-{questions[5]['answer']}-cover1.jpg")
-    try:
-        if questions[7]['answer'] == "此处上传" and 'base64' in questions[8]:
-            with open(cover1_path, "wb") as f:
-                f.write(questions[8]['base64'])
-        elif questions[7]['answer'].startswith("已附在云盘链接中"):
-            cover1_original_path = os.path.join(folder_path, questions[7]['answer'].split("文件名：:")[-1])
-            if os.path.exists(cover1_original_path):
-                os.rename(cover1_original_path, cover1_path)
-            else:
-                logging.warning(f"封面文件原始路径不存在，无法重命名\n- expected path: {cover1_original_path}")
-                cover1_path = cover1_original_path
-    except Exception as e:
-        logging.exception(f"下载封面文件1出错：\n- seq: {seq}\n- Q8 answer: {questions[7]['answer']}\n- Q9 answer: {questions[8]['answer']}\n- error: {e}")
-        cover1_path = "下载失败"
+    return file_path
 
-    cover2_path = os.path.join(folder_path, f"{seq}-{questions[5]['answer']}-cover2.jpg")
+
+def _save_cover(seq: int, fields: FieldMap, role: str, folder_path: str, cover_path: str) -> str:
+    """ 根据封面 _role_ 来源字段的回答保存封面文件，返回封面路径或“下载失败”“无需上传”等状态文本。
+
+    + “此处上传”：上传字段的附件在获取时已写入 _cover_path_，路径不同时移动到 _cover_path_；
+    + “已附在云盘链接中”：将随视频一同下载的原始封面文件重命名为 _cover_path_，因此须在视频下载完成后调用；
+    + “……无需上传”：返回“无需上传”。
+    """
+    source, upload = UPLOAD_ROLES[role]
     try:
-        if questions[10]['answer'] == "此处上传" and 'base64' in questions[11]:
-            with open(cover2_path, "wb") as f:
-                f.write(questions[11]['base64'])
-        elif questions[10]['answer'].startswith("已附在云盘链接中"):
-            cover2_original_path = os.path.join(folder_path, questions[10]['answer'].split("文件名：:")[-1])
-            if os.path.exists(cover2_original_path):
-                os.rename(cover2_original_path, cover2_path)
+        if fields.answer(source) == "此处上传" and 'path' in fields[upload]:
+            if os.path.abspath(fields[upload]['path']) != os.path.abspath(cover_path):
+                os.replace(fields[upload]['path'], cover_path)
+        elif fields.answer(source).startswith("已附在云盘链接中"):
+            cover_original_path = os.path.join(folder_path, fields.answer(source).split("文件名：:")[-1])
+            if os.path.exists(cover_original_path):
+                os.rename(cover_original_path, cover_path)
             else:
-                logging.warning(f"封面文件原始路径不存在，无法重命名\n- expected path: {cover2_original_path}")
-                cover2_path = cover2_original_path
-        elif questions[10]['answer'].endswith("无需上传"):
-            cover2_path = "无需上传"
+                logging.warning(f"封面文件原始路径不存在，无法重命名\n- expected path: {cover_original_path}")
+                cover_path = cover_original_path
+        elif fields.answer(source).endswith("无需上传"):
+            cover_path = "无需上传"
     except Exception as e:
-        logging.exception(f"下载封面文件2出错：\n- seq: {seq}\n- Q10 answer: {questions[10]['answer']}\n- Q11 answer: {questions[11]['answer']}\n- error: {e}")
-        cover2_path = "下载失败"
-    
-    # 组合预约信息文本
+        logging.exception(f"下载封面文件出错：\n- seq: {seq}\n- {fields.label(source)} answer: {fields.answer(source)}\n- {fields.label(upload)} answer: {fields.answer(upload)}\n- error: {e}")
+        cover_path = "下载失败"
+    return cover_path
+
+
+def _format_path(path: str) -> str:
+    """ 将本地文件路径格式化为 Markdown 链接；“下载失败”等状态文本原样返回。"""
+    if path in ("下载失败", "无需上传", "下载中", "等待视频下载"):
+        return path
+    return f'[{path}](<file:///{path}>)'
+
+
+def _format_preview(previews: dict, role: str, ratio: str) -> str:
+    """ 封面的缩略图和裁剪版本，没有时返回空字符串。"""
+    preview = (previews or {}).get(role)
+    if not preview:
+        return ""
+    return (NEWLINE + f"    + 预览：![{role}](<file:///{preview['thumb']}>)"
+            + NEWLINE + f"    + 裁剪为 {ratio}：**{_format_path(preview['crop'])}**")
+
+
+def _format_booking_info(seq: int, rid: str, questions: list, video_path: str, cover1_path: str, cover2_path: str,
+                         previews: dict = None) -> str:
+    """ 组合单条预约信息的 Markdown 文本（不含日期标题）；提供 _previews_ 时在封面下嵌入缩略图并链接裁剪后的版本。"""
+    fields = schema.bind(questions)
     booking_info = [f"{seq}: _{rid}_"]
     booking_info.append(
         "联系人：" + NEWLINE 
-        + NEWLINE.join([f"+ {part.replace(': ', '：')}" for part in questions[0]['answer'].split("<br/>")])
+        + NEWLINE.join([f"+ {part.replace(': ', '：')}" for part in fields.answer('contact').split("<br/>")])
     )
     booking_info.append(
         "视频基本信息：" + NEWLINE
-        + f"+ 预约日期时间：{questions[1]['answer']}，**{questions[2]['answer'].replace('定时至：:', '定时至 ')}**" + NEWLINE
-        + f"+ 视频文件路径：**{f'[{video_path}](<file:///{video_path}>)' if video_path != '下载失败' else video_path}**" + NEWLINE
-        + f"+ 描述文本：\n  > {"\n  > \n  > ".join(questions[4]['answer'].split(NEWLINE))}" + NEWLINE
-        + f"+ 短标题：**{questions[5]['answer']}**"
+        + f"+ 预约日期时间：{fields.answer('date')}，**{fields.answer('schedule').replace('定时至：:', '定时至 ')}**" + NEWLINE
+        + f"+ 视频文件路径：**{_format_path(video_path)}**" + NEWLINE
+        + f"+ 描述文本：\n  > {"\n  > \n  > ".join(fields.answer('description').split(NEWLINE))}" + NEWLINE
+        + f"+ 短标题：**{fields.answer('short_title')}**"
     )
     booking_info.append(
         "视频封面：" + NEWLINE
         + f"+ 个人主页卡片封面 (3:4)：" + NEWLINE
-        + f"    + 展示方式：**{questions[6]['answer'][:4]}**" + NEWLINE
-        + f"    + 文件路径：**{f'[{cover1_path}](<file:///{cover1_path}>)' 
-                               if cover1_path != '下载失败' else cover1_path}**" + NEWLINE
-        + f"    + 裁剪说明：**{questions[9]['answer']}**" + NEWLINE
+        + f"    + 展示方式：**{fields.answer('display')[:4]}**" + NEWLINE
+        + f"    + 文件路径：**{_format_path(cover1_path)}**" + _format_preview(previews, 'cover1', "3:4") + NEWLINE
+        + f"    + 裁剪说明：**{fields.answer('cover1_crop')}**" + NEWLINE
         + f"+ 横屏分享卡片封面 (4:3)：" + NEWLINE
-        + f"    + 文件路径：**{f'[{cover2_path}](<file:///{cover2_path}>)' 
-                               if cover2_path != '下载失败' and cover2_path != '无需上传' else cover2_path}**" + NEWLINE
-        + f"    + 裁剪说明：**{questions[12]['answer']}**"
+        + f"    + 文件路径：**{_format_path(cover2_path)}**" + _format_preview(previews, 'cover2', "4:3") + NEWLINE
+        + f"    + 裁剪说明：**{fields.answer('cover2_crop')}**"
     )
     booking_info.append(
         "视频发布信息：" + NEWLINE
-        + f"+ 合集：**{questions[13]['answer']}**{
-            "" if questions[13]['answer'] != "实践纪实" else
-            "，确认已通过实践单位、实践组审核" if questions[14]['answer'] and questions[15]['answer'] else
+        + f"+ 合集：**{fields.answer('collection')}**{
+            "" if fields.answer('collection') != "实践纪实" else
+            "，确认已通过实践单位、实践组审核" if fields.answer('unit_review') and fields.answer('group_review') else
             "，待实践单位、实践组审核"
         }" + NEWLINE
-        + f"+ 链接到公众号文章：**{questions[16]['answer']}**"
+        + f"+ 链接到公众号文章：**{fields.answer('article_link')}**"
     )
-    booking_info_text = (NEWLINE + NEWLINE).join(booking_info) + NEWLINE + NEWLINE
-    
-    # 将预约信息写入 Markdown 文件
-    if not os.path.exists(file_path):
-        logging.warning(f"预约信息文件不存在，将创建新文件\n- file path: {file_path}")
-        with open(file_path, "w", encoding="utf-8") as f:
-            f.write("")
-    with open(file_path, "r+", encoding="utf-8") as f:
-        # 读取原有内容，按 `## ` 和 `### ` 分割出不同预约信息块
-        content = f.read()
-        date_blocks = re.split(r'(?m)^## ', content) if content else []
-        date_block_dict = {}    # { date: [seq_block1, seq_block2, ...], ... }
-        for block in date_blocks:
-            if not block.strip():
-                continue
-            lines = block.splitlines()
+    return (NEWLINE + NEWLINE).join(booking_info) + NEWLINE + NEWLINE
+
+
+class BookingStore:
+    """ 预约信息的结构化存储：运行期间保存在内存中，持久化为 `{save_dir}/booking_info.json`，并据此一次性渲染 `booking_info.md`。
+
+    以预约 ID _rid_ 为键，每条记录包含预约序号 _seq_、预约日期 _date_、问题列表 _questions_（仅保留问题 ID、问题文本和回答文本），
+    以及视频、封面的保存路径或状态文本 _video_、_cover1_、_cover2_。
+    首次使用时若只存在旧版的 `booking_info.md`，则将其中的预约信息块按原文导入，记录中以 _text_ 字段保存。
+
+    Args:
+        save_dir (str): 保存目录路径
+    """
+
+    def __init__(self, save_dir: str):
+        self.save_dir = save_dir
+        self.path = os.path.join(save_dir, "booking_info.json")
+        self.markdown_path = os.path.join(save_dir, "booking_info.md")
+        self.lock = threading.Lock()
+        self.entries = {}
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    self.entries = json.load(f)
+            except (OSError, json.JSONDecodeError) as e:
+                logging.warning(f"预约信息存储文件读取失败，将重新建立\n- file path: {self.path}\n- error: {e}")
+        elif os.path.exists(self.markdown_path):
+            self._import_markdown()
+
+    def _import_markdown(self):
+        """ 从旧版 `booking_info.md` 中按 `## ` 和 `### ` 分割出预约信息块并原文导入。"""
+        with open(self.markdown_path, "r", encoding="utf-8") as f:
+            content = f.read()
+        for date_block in re.split(r'(?m)^## ', content):
+            lines = date_block.splitlines()
             if not lines or not lines[0].strip():
                 continue
             date = lines[0].strip()     # 日期行
-            date_block_dict[date] = re.split(r'(?m)^### ', NEWLINE.join(lines[1:]) 
-                                             if len(lines) > 1 else "")
-            date_block_dict[date] = [seq_block for seq_block in date_block_dict[date] if seq_block.strip()]
-        # 更新当前预约信息到对应日期块
-        booking_date = questions[1]['answer']
-        if booking_date in date_block_dict:
-            # 日期块已存在，更新或添加预约信息
-            seq_blocks = date_block_dict[booking_date]
-            seq_block_dict = {}     # [ seq_block, ... ] -> { seq_num: seq_block, ... }
-            for seq_block in seq_blocks:
-                lines = seq_block.splitlines()
-                if not lines or not lines[0].strip():
+            for seq_block in re.split(r'(?m)^### ', NEWLINE.join(lines[1:])):
+                match = re.match(r'(\d+):\s*_(.*)_', seq_block.strip())
+                if not match:
                     continue
-                seq_line = lines[0].strip()                     # 预约序号行
-                seq_num = int(seq_line.split(":")[0].strip())   # 提取预约序号
-                seq_block_dict[seq_num] = seq_block             # 存储原有预约信息块
-            # 更新或添加当前预约信息块
-            seq_block_dict[seq] = booking_info_text
-            # 按预约序号降序排序后重新组合日期块内容
-            updated_seq_blocks = [seq_block_dict[num] for num in sorted(seq_block_dict.keys(), reverse=True)]
-            date_block_dict[booking_date] = updated_seq_blocks
+                seq, rid = int(match.group(1)), match.group(2)
+                self.entries[rid] = {"seq": seq, "rid": rid, "date": date, "text": seq_block.rstrip() + NEWLINE + NEWLINE}
+        logging.info(f"已从旧版预约信息文件导入：\n- file path: {self.markdown_path}\n- count: {len(self.entries)}")
+
+    def put(self, seq: int, rid: str, questions: list, video: str, cover1: str, cover2: str):
+        """ 写入或覆盖一条预约信息。"""
+        with self.lock:
+            self.entries[rid] = {
+                "seq": seq, "rid": rid, "date": schema.bind(questions).answer('date'),
+                "questions": [{key: question[key] for key in ('id', 'title', 'answer') if key in question} for question in questions],
+                "video": video, "cover1": cover1, "cover2": cover2,
+            }
+
+    def covers(self) -> list:
+        """ 返回已保存的封面文件列表，每项为 `(rid, role, path)`。"""
+        with self.lock:
+            return [(rid, role, entry[role]) for rid, entry in self.entries.items() for role in ('cover1', 'cover2')
+                    if 'text' not in entry and os.path.isfile(entry[role])]
+
+    def set_previews(self, previews: dict):
+        """ 记录封面的缩略图和裁剪版本，_previews_ 格式为 `{ (rid, role): {"thumb": ..., "crop": ...}, ... }`。"""
+        with self.lock:
+            for (rid, role), preview in previews.items():
+                if rid in self.entries:
+                    self.entries[rid].setdefault('previews', {})[role] = preview
+
+    def save(self):
+        """ 将存储写回 JSON 文件，先写入临时文件再替换。"""
+        with self.lock:
+            _atomic_write(self.path, json.dumps(self.entries, ensure_ascii=False, indent=2))
+
+    def sections(self) -> list:
+        """ 按日期降序、同一天内按预约序号降序生成各日期的 Markdown 文本。
+
+        Returns:
+            sections (list): `(date, markdown)` 元组的列表，每个日期一节，以 `## {date}` 标题开头
+        """
+        with self.lock:
+            date_block_dict = {}    # { date: [(seq, seq_block), ...], ... }
+            for entry in self.entries.values():
+                if 'text' in entry:
+                    seq_block = entry['text']
+                else:
+                    seq_block = _format_booking_info(entry['seq'], entry['rid'], entry['questions'],
+                                                     entry['video'], entry['cover1'], entry['cover2'], entry.get('previews'))
+                date_block_dict.setdefault(entry['date'], []).append((entry['seq'], seq_block))
+        return [
+            (date, f"## {date}\n\n" + "".join(f"### {seq_block}" for _, seq_block in sorted(date_block_dict[date], reverse=True)))
+            for date in sorted(date_block_dict.keys(), reverse=True)
+        ]
+
+    def render(self) -> str:
+        """ 按日期降序、同一天内按预约序号降序渲染全部预约信息，一次性写入 `booking_info.md`。
+
+        Returns:
+            file_path (str): 预约信息 Markdown 文件的路径
+        """
+        content = "".join(section for _, section in self.sections())
+        _atomic_write(self.markdown_path, content)
+        logging.info(f"预约信息文件已生成：\n- file path: {self.markdown_path}\n- count: {len(self.entries)}")
+        return self.markdown_path
+
+
+COVER_RATIOS = {'cover1': (3, 4), 'cover2': (4, 3)}     # { 封面: 裁剪比例 (宽, 高), ... }
+
+
+def _process_cover(source: str, thumb_path: str, crop_path: str, ratio: tuple, thumb_size: int) -> dict:
+    """ 解码封面图片，生成长边不超过 _thumb_size_ 的缩略图和居中裁剪为 _ratio_ 比例的版本，在进程池中执行。
+
+    Returns:
+        preview (dict): 包含缩略图路径 _thumb_ 和裁剪版本路径 _crop_ 的字典
+    """
+    with Image.open(source) as image:
+        image = ImageOps.exif_transpose(image).convert("RGB")
+        width, height = image.size
+        if width * ratio[1] > height * ratio[0]:
+            size = (max(1, round(height * ratio[0] / ratio[1])), height)
         else:
-            # 日期块不存在，创建新日期块并添加预约信息
-            date_block_dict[booking_date] = [booking_info_text]
-        logging.debug(f"更新后的条目块内容 date_block_dict：\n{json.dumps(date_block_dict, ensure_ascii=False, indent=2)}")
-        # 按日期降序排序后重新组合文件内容
-        updated_date_blocks = [f"{date}\n\n### " + "### ".join(date_block_dict[date]) for date in sorted(date_block_dict.keys(), reverse=True)]
-        logging.debug(f"更新后的日期块内容 updated_date_blocks：\n{json.dumps(updated_date_blocks, ensure_ascii=False, indent=2)}")
-        updated_content = "## " + "## ".join(updated_date_blocks)
-        logging.debug(f"更新后的预约信息文件内容 updated_content：\n{updated_content}")
-        # 写回文件
-        f.seek(0)
-        f.write(updated_content)
-        f.truncate()
+            size = (width, max(1, round(width * ratio[1] / ratio[0])))
+        crop = ImageOps.fit(image, size, method=Image.Resampling.LANCZOS)
+        crop.save(crop_path + ".tmp", format="JPEG", quality=90)
+        image.thumbnail((thumb_size, thumb_size), Image.Resampling.LANCZOS)
+        image.save(thumb_path + ".tmp", format="JPEG", quality=80)
+    os.replace(crop_path + ".tmp", crop_path)
+    os.replace(thumb_path + ".tmp", thumb_path)
+    return {"thumb": thumb_path, "crop": crop_path}
 
-    return file_path
 
+class ImageProcessor:
+    """ 封面图片的后处理：在进程池中为每个封面生成缩略图（供报告嵌入预览）和按 3:4、4:3 比例裁剪好的版本。
+
+    处理结果记录在 `{save_dir}/image_cache.json` 中，以源文件的校验和与处理参数为准，再次运行时未变化的封面直接跳过；
+    源文件的大小和修改时间都未变时不再计算校验和。依赖可选的 Pillow 库，未安装时不做处理。
+
+    Args:
+        save_dir (str): 保存目录路径
+        workers (int, optional): 进程池大小，默认为空，即 CPU 核数
+        thumb_size (int, optional): 缩略图长边的最大像素数，默认为 320
+    """
+
+    def __init__(self, save_dir: str, workers: int = None, thumb_size: int = 320):
+        self.path = os.path.join(save_dir, "image_cache.json")
+        self.workers = workers
+        self.thumb_size = thumb_size
+        self.entries = {}   # { 源文件路径: { "size": ..., "mtime": ..., "sha256": ..., "params": ..., "preview": {...} }, ... }
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    self.entries = json.load(f)
+            except (OSError, json.JSONDecodeError) as e:
+                logging.warning(f"图片处理缓存读取失败，将重新处理\n- file path: {self.path}\n- error: {e}")
+
+    def _cached(self, source: str, params: list) -> dict:
+        """ 源文件及处理参数与缓存一致、且输出文件都存在时返回缓存的结果，否则返回 None。"""
+        entry = self.entries.get(source)
+        if entry is None or entry['params'] != params or not all(map(os.path.isfile, entry['preview'].values())):
+            return None
+        stat = os.stat(source)
+        if (entry['size'], entry['mtime']) != (stat.st_size, stat.st_mtime) and entry['sha256'] != _file_checksum(source):
+            return None
+        return entry['preview']
+
+    def process(self, covers: list) -> dict:
+        """ 处理封面文件，返回 `{ (rid, role): {"thumb": ..., "crop": ...}, ... }`，处理失败的封面不在其中。
+
+        Args:
+            covers (list): `BookingStore.covers` 返回的 `(rid, role, path)` 列表
+        """
+        if Image is None:
+            logging.warning("未安装 Pillow，跳过封面图片处理，可通过 pip install pillow 安装")
+            return {}
+        previews, jobs = {}, {}
+        for rid, role, source in covers:
+            params = [list(COVER_RATIOS[role]), self.thumb_size]
+            cached = self._cached(source, params)
+            if cached is not None:
+                previews[(rid, role)] = cached
+                metrics.count("images_cached")
+                continue
+            stem = os.path.splitext(source)[0]
+            jobs[(rid, role)] = (source, params, (source, f"{stem}-thumb.jpg", f"{stem}-{'x'.join(map(str, COVER_RATIOS[role]))}.jpg",
+                                                  COVER_RATIOS[role], self.thumb_size))
+        if jobs:
+            with metrics.timer("image_processing"), ProcessPoolExecutor(max_workers=self.workers) as executor:
+                futures = {executor.submit(_process_cover, *args): key for key, (_, _, args) in jobs.items()}
+                for future in as_completed(futures):
+                    key = futures[future]
+                    source, params, _ = jobs[key]
+                    try:
+                        previews[key] = future.result()
+                    except Exception as e:
+                        logging.warning(f"封面图片处理失败：\n- file path: {source}\n- error: {e}")
+                        metrics.count("image_errors")
+                        continue
+                    stat = os.stat(source)
+                    self.entries[source] = {"size": stat.st_size, "mtime": stat.st_mtime, "sha256": _file_checksum(source),
+                                            "params": params, "preview": previews[key]}
+                    metrics.count("images_processed")
+            _atomic_write(self.path, json.dumps(self.entries, ensure_ascii=False, indent=2))
+        logging.info(f"封面图片处理完成：\n- processed: {len(previews) - len(covers) + len(jobs)}\n"
+                     f"- cached: {len(covers) - len(jobs)}\n- failed: {len(covers) - len(previews)}")
+        return previews
+
+
+HTML_TEMPLATE = """<!DOCTYPE html>
+<html lang="zh-CN">
+<head>
+<meta charset="utf-8">
+<title>{title}</title>
+<style>
+body {{ font-family: "Microsoft YaHei", "PingFang SC", "Noto Sans CJK SC", sans-serif; max-width: 960px; margin: 2em auto; line-height: 1.6; }}
+h2 {{ border-bottom: 2px solid #660874; padding-bottom: .2em; page-break-before: always; }}
+h2:first-of-type {{ page-break-before: avoid; }}
+h3 {{ color: #660874; }}
+blockquote {{ margin: .3em 0; padding-left: 1em; border-left: 3px solid #ccc; color: #555; }}
+a {{ word-break: break-all; }}
+</style>
+</head>
+<body>
+{body}
+</body>
+</html>
+"""
+
+
+def _inline_html(text: str) -> str:
+    """ 将行内 Markdown（图片、链接、粗体、斜体）转换为 HTML，链接中的文本不做强调处理。"""
+    parts = re.split(r'(!?\[[^\]]*\]\(<[^>]*>\))', text)
+    result = []
+    for part in parts:
+        image = re.fullmatch(r'!\[([^\]]*)\]\(<([^>]*)>\)', part)
+        link = re.fullmatch(r'\[([^\]]*)\]\(<([^>]*)>\)', part)
+        if image:
+            result.append(f'<img src="{html.escape(image.group(2), quote=True)}" alt="{html.escape(image.group(1), quote=True)}">')
+            continue
+        if link:
+            result.append(f'<a href="{html.escape(link.group(2), quote=True)}">{html.escape(link.group(1))}</a>')
+            continue
+        result.append(re.sub(r'(?<![\w/])_(.+?)_(?!\w)', r'<em>\1</em>', html.escape(part)))
+    # 粗体可能包裹链接，须在拼接后处理
+    return re.sub(r'\*\*(.*?)\*\*', r'<strong>\1</strong>', "".join(result))
+
+
+def markdown_to_html(text: str) -> str:
+    """ 将 `_format_booking_info` 生成的 Markdown 转换为 HTML 片段。
+
+    只支持报告中用到的语法：`##`、`###` 标题，以 `+ ` 开头、按缩进嵌套的列表，列表项下以 `>` 开头的引用，
+    以及行内的链接、粗体和斜体，无需调用 Pandoc。
+    """
+    output = []
+    indents = []        # 当前打开的各层列表的缩进
+    quote_lines = None  # 正在收集的引用行
+
+    def close_quote():
+        nonlocal quote_lines
+        if quote_lines is not None:
+            output.append("<blockquote>" + "<br>".join(quote_lines) + "</blockquote>")
+            quote_lines = None
+
+    def close_lists(indent: int = -1):
+        while indents and indents[-1] > indent:
+            indents.pop()
+            output.append("</li></ul>")
+
+    for line in text.splitlines():
+        if match := re.match(r'^\s*>\s?(.*)$', line):
+            if quote_lines is None:
+                quote_lines = []
+            quote_lines.append(_inline_html(match.group(1)))
+            continue
+        close_quote()
+        if not line.strip():
+            continue
+        if match := re.match(r'^(#{2,3}) (.*)$', line):
+            close_lists()
+            level = len(match.group(1))
+            output.append(f"<h{level}>{_inline_html(match.group(2))}</h{level}>")
+        elif match := re.match(r'^( *)\+ (.*)$', line):
+            indent = len(match.group(1))
+            close_lists(indent)
+            if not indents or indents[-1] < indent:
+                indents.append(indent)
+                output.append("<ul>")
+            else:
+                output.append("</li>")
+            output.append(f"<li>{_inline_html(match.group(2))}")
+        else:
+            close_lists()
+            output.append(f"<p>{_inline_html(line)}</p>")
+    close_quote()
+    close_lists()
+    return NEWLINE.join(output) + NEWLINE
+
+
+class ReportRenderer:
+    """ 按日期分节渲染 `booking_info.md` 之外的报告（HTML、PDF），以各节内容的哈希值缓存渲染结果，只重新渲染有变化的节。
+
+    缓存保存在 `{save_dir}/.report_cache/` 中，文件名即渲染方式与该节 Markdown 的哈希值，渲染完成后清理不再使用的缓存。
+
+    + `"pandoc"`：安装了 `pypdf` 时，每个有变化的日期分别由 Pandoc 转换为 PDF 并缓存（多节并行），再合并为 `booking_info.pdf`；
+      否则整体转换一次，报告内容未变化时跳过；
+    + `"html"`：由内置的 `markdown_to_html` 将各节转换为 HTML 片段并缓存，拼接为 `booking_info.html`；
+      导出 PDF 时由无头浏览器打印，不需要 Pandoc 和 LaTeX。
+
+    Args:
+        save_dir (str): 保存目录路径
+        renderer (str, optional): 渲染方式，`"pandoc"` 或 `"html"`，默认为 `"pandoc"`
+        max_workers (int, optional): 并行转换的最大节数，默认为 4
+        browser (Callable[[], ChromiumPage], optional): 返回浏览器页面对象的函数，`"html"` 方式导出 PDF 时使用
+    """
+
+    def __init__(self, save_dir: str, renderer: str = "pandoc", max_workers: int = 4, browser=None):
+        self.save_dir = save_dir
+        self.renderer = renderer
+        self.max_workers = max_workers
+        self.browser = browser
+        self.cache_dir = os.path.join(save_dir, ".report_cache")
+        self.used = set()   # 本次渲染用到的缓存文件
+
+    def _cached(self, kind: str, content: str, ext: str, render) -> str:
+        """ 返回内容 _content_ 的缓存文件路径，缓存不存在时调用 `render(path)` 生成。"""
+        digest = hashlib.sha256(f"{kind}\n{content}".encode("utf-8")).hexdigest()[:32]
+        path = os.path.join(self.cache_dir, f"{kind}-{digest}.{ext}")
+        self.used.add(os.path.basename(path))
+        if not os.path.isfile(path):
+            os.makedirs(self.cache_dir, exist_ok=True)
+            render(path)
+            metrics.count("report_sections_rendered")
+        else:
+            metrics.count("report_sections_cached")
+        return path
+
+    def _prune(self):
+        """ 删除本次渲染没有用到的缓存文件。"""
+        for name in os.listdir(self.cache_dir) if os.path.isdir(self.cache_dir) else []:
+            if name not in self.used:
+                os.remove(os.path.join(self.cache_dir, name))
+
+    def render(self, sections: list, export_pdf: bool = True) -> list:
+        """ 渲染报告。
 
-def download_from_cloud(link: str, save_dir: str, save_name: str, downloader_script_dir: str):
-    """ 调用 THU-Cloud-Downloader 工具下载文件并保存到本地。
+        Args:
+            sections (list): `BookingStore.sections` 返回的 `(date, markdown)` 列表
+            export_pdf (bool, optional): 是否导出 PDF，默认为 True
+
+        Returns:
+            paths (list): 生成的报告文件路径列表
+        """
+        self.used = set()
+        if self.renderer == "html":
+            paths = self._render_html(sections, export_pdf)
+        elif export_pdf:
+            paths = self._render_pandoc(sections)
+        else:
+            paths = []
+        self._prune()
+        return paths
+
+    def _render_html(self, sections: list, export_pdf: bool) -> list:
+        def render_fragment(markdown: str):
+            return lambda path: _atomic_write(path, markdown_to_html(markdown))
+
+        fragments = []
+        for _, markdown in sections:
+            with open(self._cached("html", markdown, "html", render_fragment(markdown)), "r", encoding="utf-8") as f:
+                fragments.append(f.read())
+        html_path = os.path.join(self.save_dir, "booking_info.html")
+        document = HTML_TEMPLATE.format(title="预约信息", body="".join(fragments))
+        _atomic_write(html_path, document)
+        logging.info(f"HTML 报告已生成：\n- file path: {html_path}\n- sections: {len(sections)}")
+        paths = [html_path]
+
+        pdf_path = os.path.join(self.save_dir, "booking_info.pdf")
+        if export_pdf and self.browser is not None:
+            def print_pdf(path: str):
+                # 报告中的链接均为本地文件，须以 file:// 打开
+                tab = self.browser().new_tab(pathlib.Path(html_path).resolve().as_uri())
+                try:
+                    content = tab.save(as_pdf=True)
+                finally:
+                    tab.close()
+                with open(path + ".tmp", "wb") as f:
+                    f.write(content)
+                os.replace(path + ".tmp", path)
+
+            with metrics.timer("pdf_convert"):
+                shutil.copyfile(self._cached("pdf", document, "pdf", print_pdf), pdf_path)
+            logging.info(f"PDF 报告已生成：\n- file path: {pdf_path}")
+            paths.append(pdf_path)
+        return paths
+
+    def _render_pandoc(self, sections: list) -> list:
+        pdf_path = os.path.join(self.save_dir, "booking_info.pdf")
+
+        def convert(markdown: str):
+            return lambda path: pypandoc.convert_text(markdown, 'pdf', format='md', outputfile=path)
+
+        with metrics.timer("pdf_convert"):
+            if PdfWriter is None:
+                # 无法合并分节的 PDF，整体转换；内容未变化时直接使用缓存
+                document = "".join(markdown for _, markdown in sections)
+                shutil.copyfile(self._cached("pandoc-full", document, "pdf", convert(document)), pdf_path)
+            else:
+                with ThreadPoolExecutor(max_workers=max(1, self.max_workers)) as executor:
+                    parts = list(executor.map(lambda section: self._cached("pandoc", section[1], "pdf", convert(section[1])),
+                                              sections))
+                writer = PdfWriter()
+                for part in parts:
+                    writer.append(part)
+                with open(pdf_path + ".tmp", "wb") as f:
+                    writer.write(f)
+                os.replace(pdf_path + ".tmp", pdf_path)
+        logging.info(f"PDF 报告已生成：\n- file path: {pdf_path}\n- sections: {len(sections)}")
+        return [pdf_path]
+
+
+def _atomic_write(file_path: str, content: str):
+    """ 先写入同目录下的临时文件，再替换目标文件，避免中断时留下不完整的文件。"""
+    os.makedirs(os.path.dirname(file_path) or ".", exist_ok=True)
+    temp_path = file_path + ".tmp"
+    with open(temp_path, "w", encoding="utf-8") as f:
+        f.write(content)
+    os.replace(temp_path, file_path)
+
+
+CLOUD_URL = "https://cloud.tsinghua.edu.cn"
+
+
+class CloudClient:
+    """ 清华云盘共享链接的进程内下载器，取代调用 THU-Cloud-Downloader 子进程。
+
+    + 下载时先写入 `{save_name}.part` 临时文件，再次下载同一文件时通过 HTTP `Range` 请求从已下载的位置续传；
+    + 续传时以 `If-Range` 附上开始下载时记录的 ETag 或 Last-Modified，服务器上的文件已变化时从头重新下载；
+    + 下载完成后按服务器报告的大小（响应头，未报告时取自文件夹共享的目录列表）核对，核对通过才替换为目标文件；
+    + 上次保存时的校验和只用于在媒体存储中查找可复用的文件，不用于拒绝下载结果，共享链接背后被替换的文件可以正常下载；
+    + 对于文件夹（`d`）共享链接，先列出共享目录，只下载其中最大的 MP4 文件和指定的附加文件，而不是下载整个文件夹。
+
+    暂不支持设置了访问密码的共享链接。
+
+    Args:
+        pool_size (int, optional): 连接池大小，默认为 4
+        timeout (float, optional): 连接和读取超时时间（秒），默认为 30
+        chunk_size (int, optional): 写入文件的分块大小（字节），默认为 1 MiB
+        base_url (str, optional): 云盘服务地址，默认为 `CLOUD_URL`；共享链接须以该地址开头
+    """
+
+    def __init__(self, pool_size: int = 4, timeout: float = 30, chunk_size: int = 1 << 20, base_url: str = CLOUD_URL):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.chunk_size = chunk_size
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def parse_link(self, link: str) -> tuple:
+        """ 解析共享链接，返回共享类型（`d` 或 `f`）和共享标识。"""
+        match = re.match(rf'{re.escape(self.base_url)}/([df])/([0-9A-Za-z]+)', link.strip())
+        if not match:
+            raise ValueError(f"URL 格式不符合要求，无法识别是文件链接还是文件夹链接\n- link: {link}\n- expected prefix: {self.base_url}/d/ or {self.base_url}/f/")
+        return match.group(1), match.group(2)
+
+    def list_share(self, token: str, path: str = "/") -> list:
+        """ 递归列出文件夹共享中的全部文件。
+
+        Returns:
+            files (list): 文件列表，每项包含共享内路径 _path_、文件名 _name_ 和文件大小 _size_
+        """
+        response = self.session.get(f"{self.base_url}/api/v2.1/share-links/{token}/dirents/",
+                                    params={"path": path}, timeout=self.timeout)
+        response.raise_for_status()
+        files = []
+        for dirent in response.json().get('dirent_list', []):
+            if dirent.get('is_dir'):
+                files.extend(self.list_share(token, dirent['folder_path']))
+            else:
+                files.append({"path": dirent['file_path'], "name": dirent['file_name'], "size": dirent.get('size')})
+        return files
+
+    @staticmethod
+    def _validator(response: requests.Response) -> str:
+        """ 响应中可用于 `If-Range` 的版本标识：强 ETag，没有时为 Last-Modified；都没有时返回 None。"""
+        etag = response.headers.get('ETag')
+        if etag and not etag.startswith("W/"):
+            return etag
+        return response.headers.get('Last-Modified')
+
+    @staticmethod
+    def _total_size(response: requests.Response) -> int:
+        """ 服务器报告的文件总大小：取自 `Content-Range` 的总长度，完整响应时取自 `Content-Length`；未知时返回 None。"""
+        content_range = response.headers.get('Content-Range', '')
+        match = re.search(r'/(\d+)$', content_range)
+        if match:
+            return int(match.group(1))
+        if response.status_code == 200 and 'Content-Length' in response.headers:
+            return int(response.headers['Content-Length'])
+        return None
+
+    def probe(self, url: str) -> dict:
+        """ 以 HEAD 请求获取文件的大小 _size_ 和版本标识 _validator_（ETag 或 Last-Modified）；请求失败时返回空字典。"""
+        try:
+            response = self.session.head(url, allow_redirects=True, timeout=self.timeout)
+            response.raise_for_status()
+        except requests.RequestException as e:
+            logging.debug(f"获取文件信息失败：\n- url: {url}\n- error: {e}")
+            return {}
+        size = int(response.headers['Content-Length']) if 'Content-Length' in response.headers else None
+        return {"size": size, "validator": self._validator(response)}
+
+    def download_file(self, url: str, file_path: str, expected_size: int = None) -> dict:
+        """ 下载单个文件，支持断点续传和完整性校验。
+
+        开始下载时将响应的版本标识（ETag 或 Last-Modified）记录在 `{file_path}.part.json` 中，续传时以 `If-Range` 发送，
+        服务器上的文件已变化时返回完整内容，从头重新下载，不会把新旧版本拼接在一起。下载完成后按服务器报告的大小核对。
+
+        Args:
+            url (str): 文件下载地址
+            file_path (str): 保存路径
+            expected_size (int, optional): 预期的文件大小（字节）；服务器在响应头中报告了大小时以后者为准
+
+        Returns:
+            info (dict): 包含保存路径 _path_、文件大小 _size_ 和校验和 _sha256_ 的字典
+        """
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        temp_path = file_path + ".part"
+        meta_path = temp_path + ".json"
+        offset = os.path.getsize(temp_path) if os.path.exists(temp_path) else 0
+        validator = None
+        if offset:
+            try:
+                with open(meta_path, "r", encoding="utf-8") as f:
+                    meta = json.load(f)
+                validator = meta.get('validator') if meta.get('url') == url else None
+            except (OSError, json.JSONDecodeError):
+                pass
+            if not validator:
+                logging.info(f"临时文件没有对应的版本标识，无法确认服务器上的文件未变，将重新下载\n- file path: {temp_path}")
+                offset = 0
+
+        headers = {"Range": f"bytes={offset}-", "If-Range": validator} if offset else {}
+        with self.session.get(url, headers=headers, stream=True, timeout=self.timeout) as response:
+            if response.status_code == 416 and offset:
+                # 版本未变且临时文件已完整，服务器无可续传内容
+                total = self._total_size(response)
+                if total is not None and total != offset:
+                    os.remove(temp_path)
+                    raise IOError(f"临时文件大小与服务器上的文件不符，已删除临时文件\n- file path: {temp_path}\n- size: {offset}\n- server size: {total}")
+                logging.debug(f"临时文件已完整：\n- file path: {temp_path}\n- size: {offset}")
+                expected_size = offset
+            else:
+                response.raise_for_status()
+                if offset and response.status_code != 206:
+                    logging.info(f"服务器上的文件已变化或不支持断点续传，将重新下载\n- url: {url}\n- status: {response.status_code}")
+                    offset = 0
+                elif offset:
+                    logging.info(f"断点续传：\n- file path: {file_path}\n- offset: {offset}")
+                total = self._total_size(response)
+                if total is not None:
+                    if expected_size is not None and total != expected_size:
+                        logging.info(f"服务器报告的文件大小与预期不同，以服务器为准\n- url: {url}\n- size: {total}\n- expected size: {expected_size}")
+                    expected_size = total
+                if not offset:
+                    validator = self._validator(response)
+                    if validator:
+                        _atomic_write(meta_path, json.dumps({"url": url, "validator": validator}, ensure_ascii=False))
+                    elif os.path.exists(meta_path):
+                        os.remove(meta_path)
+                with open(temp_path, "ab" if offset else "wb") as f:
+                    for chunk in response.iter_content(chunk_size=self.chunk_size):
+                        f.write(chunk)
+                        metrics.count("cloud_bytes", len(chunk))
+
+        size = os.path.getsize(temp_path)
+        if expected_size is not None and size != expected_size:
+            # 保留临时文件，下次从此处续传
+            raise IOError(f"下载文件大小不符，下次运行将断点续传\n- file path: {temp_path}\n- size: {size}\n- expected size: {expected_size}")
+        sha256 = _file_checksum(temp_path)
+        os.replace(temp_path, file_path)
+        if os.path.exists(meta_path):
+            os.remove(meta_path)
+        return {"path": file_path, "size": size, "sha256": sha256}
+
+    def _fetch(self, url: str, file_path: str, source: str, expected_size: int = None, expected_sha256: str = None,
+               media: MediaStore = None) -> dict:
+        """ 下载单个文件；提供 _media_ 和来源 _source_ 时先在媒体存储中查找，找到则直接链接，否则下载后纳入存储。"""
+        info = media.fetch(source, file_path, expected_size, expected_sha256) if media and source else None
+        if info is None:
+            info = self.download_file(url, file_path, expected_size)
+            if expected_sha256 and info['sha256'] != expected_sha256:
+                logging.info(f"共享文件的内容与上次保存时不同，已保存新版本\n- file path: {file_path}\n- sha256: {info['sha256']}")
+            if media:
+                info = media.adopt(file_path, source, info['sha256'])
+        return info
+
+    def download(self, link: str, save_dir: str, save_name: str, extra_files: tuple = (), expected_sha256: str = None,
+                 media: MediaStore = None) -> dict:
+        """ 下载共享链接中的视频文件并保存为 `{save_dir}/{save_name}`。
+
+        + 若 _link_ 为文件（`f`）共享链接，直接下载该文件；
+        + 若 _link_ 为文件夹（`d`）共享链接，只下载其中最大的 MP4 文件，以及文件名在 _extra_files_ 中的附加文件（保存为 `{save_dir}/{文件名}`）。
+
+        提供 _media_ 时，文件以共享标识、共享内路径（文件共享为 HEAD 请求得到的版本标识）和大小为来源在媒体存储中去重，已有的文件不再传输；
+        共享链接背后的文件被替换后来源随之改变，不会误用旧文件。文件共享无法通过 HEAD 请求获取大小时不查找存储，直接下载。
+
+        Args:
+            link (str): 共享链接
+            save_dir (str): 保存目录路径
+            save_name (str): 保存文件名，须包含扩展名
+            extra_files (tuple, optional): 需要一并下载的附加文件名，仅对文件夹共享链接有效
+            expected_sha256 (str, optional): 上次保存的视频文件校验和，只用于在媒体存储中查找可复用的文件
+            media (MediaStore, optional): 媒体存储；默认为空，此时总是下载
+
+        Returns:
+            info (dict): 视频文件的保存路径 _path_、大小 _size_ 和校验和 _sha256_
+        """
+        share_type, token = self.parse_link(link)
+        if share_type == 'f':
+            url = f"{self.base_url}/f/{token}/?dl=1"
+            remote = self.probe(url) if media else {}
+            source = f"f/{token}|{remote['size']}|{remote['validator'] or ''}" if remote.get('size') is not None else None
+            info = self._fetch(url, os.path.join(save_dir, save_name), source, expected_size=remote.get('size'),
+                               expected_sha256=expected_sha256, media=media)
+            recorder.record_json("cloud", token, {"type": "f", "files": [{"path": f"/{save_name}", "name": save_name, "size": info['size']}]})
+            return info
+
+        files = self.list_share(token)
+        recorder.record_json("cloud", token, {"type": "d", "files": files})
+        videos = [file for file in files if file['name'].lower().endswith('.mp4')]
+        if not videos:
+            raise FileNotFoundError(f"共享文件夹中未找到 MP4 文件\n- link: {link}\n- files: {[file['path'] for file in files]}")
+        largest = max(videos, key=lambda file: file['size'] or 0)
+        logging.info(f"从共享文件夹中选择视频文件：\n- link: {link}\n- file: {largest['path']}\n- size: {largest['size']}")
+        for name in extra_files:
+            matched = [file for file in files if file['name'] == name]
+            if not matched:
+                logging.warning(f"共享文件夹中未找到附加文件\n- link: {link}\n- file name: {name}")
+                continue
+            self._fetch(f"{self.base_url}/d/{token}/files/?p={quote(matched[0]['path'])}&dl=1",
+                        os.path.join(save_dir, name), f"d/{token}{matched[0]['path']}|{matched[0]['size']}",
+                        expected_size=matched[0]['size'], media=media)
+        return self._fetch(f"{self.base_url}/d/{token}/files/?p={quote(largest['path'])}&dl=1",
+                           os.path.join(save_dir, save_name), f"d/{token}{largest['path']}|{largest['size']}",
+                           expected_size=largest['size'], expected_sha256=expected_sha256, media=media)
+
+
+@metrics.timed("cloud_download")
+def download_from_cloud(link: str, save_dir: str, save_name: str, downloader_script_dir: str = None,
+                        extra_files: tuple = (), cloud_client: CloudClient = None, expected_sha256: str = None,
+                        media: MediaStore = None) -> dict:
+    """ 下载清华云盘共享链接中的视频文件并保存到本地。
+
+    未提供 _downloader_script_dir_ 时使用进程内的 `CloudClient` 下载，支持断点续传、完整性校验和文件夹共享的选择性下载，
+    参数 _extra_files_、_expected_sha256_、_media_ 仅在此时有效；否则调用 THU-Cloud-Downloader 工具下载：
     
     + 若 _link_ 为文件（`f`）共享链接，相当于在命令行中执行以下命令：
     ```
-    python thu_cloud_download.py -l {link} -s {save_dir} -n {save_name} -y
+    python thu_cloud_download.py -l {link} -s {save_dir}/.download -n {save_name} -y
     ```
-    + 若 _link_ 为文件夹（`d`）共享链接，则下载该文件夹下的所有文件，并将它们保存到 `{save_dir}\\` 目录下，相当于在命令行中执行以下命令：
+    + 若 _link_ 为文件夹（`d`）共享链接，则下载该文件夹下的所有文件，相当于在命令行中执行以下命令：
     ```
-    python thu_cloud_download.py \\
-        -l {link} \\
-        -s {os.path.dirname(os.path.normpath(save_dir))} \\
-        -n {os.path.basename(os.path.normpath(save_dir))} \\
-        -y
+    python thu_cloud_download.py -l {link} -s {save_dir} -n .download -y
     ```
-    然后找到最大的 MP4 文件并重命名为 _save_name_。
+    然后找到其中最大的 MP4 文件并重命名为 _save_name_。
+
+    脚本先下载到临时目录 `{save_dir}/.download/`，成功后再逐个替换 _save_dir_ 中的同名文件：预约文件夹中的文件可能是媒体存储对象的硬链接，
+    脚本原地覆盖时会改写存储中的对象和链接到它的其他预约，替换目录项则不会；下载失败时原有文件保持不变。
 
     Args:
         link (str): 文件链接
         save_dir (str): 保存目录路径
         save_name (str): 保存文件名，须包含扩展名
+        downloader_script_dir (str, optional): THU-Cloud-Downloader 脚本所在目录；默认为空，此时使用进程内下载器
+        extra_files (tuple, optional): 文件夹共享中需要一并下载的附加文件名，如随视频上传的封面
+        cloud_client (CloudClient, optional): 进程内下载器；默认为空，此时新建一个
+        expected_sha256 (str, optional): 上次保存的视频文件校验和，只用于在媒体存储中查找可复用的文件
+        media (MediaStore, optional): 媒体存储，已有的文件不再下载
+
+    Returns:
+        info (dict): 使用进程内下载器时为视频文件的保存路径 _path_、大小 _size_ 和校验和 _sha256_；否则为空字典
     """
+    if not downloader_script_dir:
+        return (cloud_client or CloudClient()).download(link, save_dir, save_name, extra_files, expected_sha256, media)
+
     script_dir = os.path.abspath(downloader_script_dir)
     script_path = os.path.join(script_dir, "thu_cloud_download.py")
     script_venv = os.path.join(script_dir, ".venv", "Scripts", "python.exe")
@@ -354,50 +2456,223 @@ def download_from_cloud(link: str, save_dir: str, save_name: str, downloader_scr
     if not os.path.exists(script_venv):
         raise FileNotFoundError(f"Python executable not found in virtual environment: {script_venv}")
     
+    download_dir = os.path.join(save_dir, ".download")
     prefix = {'d': 'https://cloud.tsinghua.edu.cn/d/', 'f': 'https://cloud.tsinghua.edu.cn/f/'}
     if link.startswith(prefix['d']):
         share_type = 'd'
-        command = [script_venv, script_path, "-l", link, 
-                   "-s", os.path.dirname(os.path.normpath(save_dir)), 
-                   "-n", os.path.basename(os.path.normpath(save_dir)), "-y"]
+        command = [script_venv, script_path, "-l", link, "-s", save_dir, "-n", ".download", "-y"]
     elif link.startswith(prefix['f']):
         share_type = 'f'
-        command = [script_venv, script_path, "-l", link, "-s", save_dir, "-n", save_name, "-y"]
+        command = [script_venv, script_path, "-l", link, "-s", download_dir, "-n", save_name, "-y"]
     else:
         raise ValueError(f"URL 格式不符合要求，无法识别是文件链接还是文件夹链接\n- link: {link}\n- expected prefix: {prefix['d']} or {prefix['f']}")
 
     env = os.environ.copy()
     env["PYTHONIOENCODING"] = "utf-8"
-    result = subprocess.run(command, cwd=script_dir, capture_output=True, text=True, env=env, encoding="utf-8")
-    logging.debug(f"THU-Cloud-Downloader 输出：\n- stdout: {result.stdout}")
-    if result.returncode != 0:
-        raise RuntimeError(f"THU-Cloud-Downloader 运行错误\n- stderr: {result.stderr}")
-    
+    shutil.rmtree(download_dir, ignore_errors=True)
+    os.makedirs(download_dir if share_type == 'f' else save_dir, exist_ok=True)
+    try:
+        with metrics.timer("cloud_script"):
+            result = subprocess.run(command, cwd=script_dir, capture_output=True, text=True, env=env, encoding="utf-8")
+        logging.debug(f"THU-Cloud-Downloader 输出：\n- stdout: {result.stdout}")
+        if result.returncode != 0:
+            raise RuntimeError(f"THU-Cloud-Downloader 运行错误\n- stderr: {result.stderr}")
+
+        # 以替换目录项的方式移入保存目录，不改写可能被链接的原有文件
+        downloaded_files = []
+        for root, _, files in os.walk(download_dir):
+            target_dir = os.path.join(save_dir, os.path.relpath(root, download_dir))
+            os.makedirs(target_dir, exist_ok=True)
+            for name in files:
+                os.replace(os.path.join(root, name), os.path.join(target_dir, name))
+                downloaded_files.append(os.path.normpath(os.path.join(target_dir, name)))
+    finally:
+        shutil.rmtree(download_dir, ignore_errors=True)
+
     # 对于文件夹链接，找到最大的 MP4 文件并重命名为 save_name
     if share_type == 'd':
-        downloaded_files = [f for f in os.listdir(save_dir) if f.lower().endswith('.mp4')]
+        downloaded_files = [f for f in downloaded_files if f.lower().endswith('.mp4')]
         if not downloaded_files:
             logging.warning(f"未找到下载的 MP4 文件\n- expected directory: {save_dir}")
-        largest_file = max(downloaded_files, key=lambda f: os.path.getsize(os.path.join(save_dir, f)))
-        largest_file_path = os.path.join(save_dir, largest_file)
+            return {}
+        largest_file_path = max(downloaded_files, key=os.path.getsize)
         final_save_path = os.path.join(save_dir, save_name)
-        os.rename(largest_file_path, final_save_path)
+        os.replace(largest_file_path, final_save_path)
+    return {}
+
+
+def _is_transient(error: Exception) -> bool:
+    """ 判断下载错误是否可能在重试后消失：网络请求错误和传输中的读写错误可以重试，链接格式错误、文件或脚本缺失等则不必重试。"""
+    if isinstance(error, (FileNotFoundError, PermissionError, NotADirectoryError, IsADirectoryError)):
+        return False
+    return isinstance(error, (requests.RequestException, OSError))
+
+
+class DownloadScheduler:
+    """ 视频下载调度器：由 _workers_ 个工作线程从任务队列中取出下载任务并发执行。
+
+    每个任务调用 `download_from_cloud` 下载，网络或传输错误后按指数退避重试，最多重试 _retries_ 次，其他错误直接判为失败；使用进程内下载器时，重试会从已下载的位置续传。
+    任务结束后以视频保存路径（最终失败时为“下载失败”）和校验和（未知时为空）调用任务的回调函数，用于更新预约信息。
+    批量模式中多个问卷共享同一个调度器，任务按 _group_ 分组，`wait` 只等待某一组的任务完成。
+
+    Args:
+        downloader_script_dir (str): THU-Cloud-Downloader 脚本所在目录；为空时使用进程内下载器
+        workers (int, optional): 并发下载的工作线程数，默认为 2
+        retries (int, optional): 单个任务失败后的最大重试次数，默认为 2
+        backoff (float, optional): 首次重试前的等待时间（秒），之后每次翻倍，默认为 5
+        cloud_url (str, optional): 进程内下载器使用的云盘服务地址，默认为 `CLOUD_URL`
+    """
+
+    def __init__(self, downloader_script_dir: str, workers: int = 2, retries: int = 2, backoff: float = 5,
+                 cloud_url: str = CLOUD_URL):
+        self.downloader_script_dir = downloader_script_dir
+        self.cloud_client = None if downloader_script_dir else CloudClient(pool_size=max(4, workers), base_url=cloud_url)
+        self.retries = retries
+        self.backoff = backoff
+        self.jobs = queue.Queue()
+        self.pending = collections.Counter()    # { group: 未完成的任务数, ... }
+        self.condition = threading.Condition()
+        self.threads = [threading.Thread(target=self._worker, daemon=True) for _ in range(max(1, workers))]
+        for thread in self.threads:
+            thread.start()
+
+    def submit(self, link: str, save_dir: str, save_name: str, callback=None,
+               extra_files: tuple = (), expected_sha256: str = None, group: str = None, media: MediaStore = None):
+        """ 提交下载任务，参数含义同 `download_from_cloud`；_callback_ 接收视频保存路径或“下载失败”，以及校验和；_group_ 为任务所属的分组。"""
+        logging.info(f"已加入下载队列：\n- link: {link}\n- save path: {os.path.join(save_dir, save_name)}")
+        with self.condition:
+            self.pending[group] += 1
+        self.jobs.put((link, save_dir, save_name, callback, extra_files, expected_sha256, group, media))
+
+    def _worker(self):
+        while True:
+            job = self.jobs.get()
+            if job is None:
+                self.jobs.task_done()
+                return
+            link, save_dir, save_name, callback, extra_files, expected_sha256, group, media = job
+            video_path = os.path.join(save_dir, save_name)
+            info = {}
+            for attempt in range(self.retries + 1):
+                try:
+                    info = download_from_cloud(link, save_dir, save_name, self.downloader_script_dir,
+                                               extra_files, self.cloud_client, expected_sha256, media)
+                    logging.info(f"视频下载完成：\n- save path: {video_path}")
+                    break
+                except Exception as e:
+                    if attempt < self.retries and _is_transient(e):
+                        metrics.count("download_retries")
+                        delay = self.backoff * 2 ** attempt
+                        logging.warning(f"下载视频文件出错，{delay} 秒后重试\n- link: {link}\n- attempt: {attempt + 1}/{self.retries + 1}\n- error: {e}")
+                        time.sleep(delay)
+                    else:
+                        logging.exception(f"下载视频文件出错：\n- link: {link}\n- error: {e}")
+                        metrics.count("download_failures")
+                        video_path = "下载失败"
+                        break
+            try:
+                if callback:
+                    callback(video_path, info.get('sha256') if video_path != "下载失败" else None)
+            except Exception as e:
+                logging.exception(f"下载任务回调出错：\n- link: {link}\n- error: {e}")
+            finally:
+                with self.condition:
+                    self.pending[group] -= 1
+                    self.condition.notify_all()
+                self.jobs.task_done()
+
+    def wait(self, group: str = None):
+        """ 等待 _group_ 组的全部任务完成（含回调），其他组的任务和工作线程不受影响。"""
+        with self.condition:
+            self.condition.wait_for(lambda: self.pending[group] <= 0)
+
+    def join(self):
+        """ 等待队列中的全部任务完成，然后结束工作线程。"""
+        self.jobs.join()
+        for _ in self.threads:
+            self.jobs.put(None)
+        for thread in self.threads:
+            thread.join()
+
+
+class BatchContext:
+    """ 批量模式和监视模式中跨问卷、跨轮次共享的资源：查询线程池、按主机限速器、浏览器实例和下载调度器，
+    以及按保存目录保留的查询会话和接口客户端，再次处理同一问卷时直接复用，不必重新验证密码和建立连接。
+
+    Args:
+        executor (ThreadPoolExecutor): 各问卷的日期查询共用的线程池
+        rate_limiter (RateLimiter): 各问卷共用的请求限速器
+        browser (BrowserHost): 各问卷会话共用的浏览器实例
+        scheduler (DownloadScheduler): 各问卷共用的下载调度器，任务以问卷的保存目录分组
+    """
+
+    def __init__(self, executor: ThreadPoolExecutor, rate_limiter: RateLimiter, browser: BrowserHost,
+                 scheduler: DownloadScheduler):
+        self.executor = executor
+        self.rate_limiter = rate_limiter
+        self.browser = browser
+        self.scheduler = scheduler
+        self.sessions = {}  # { save_dir: SessionManager, ... }
+        self.clients = {}   # { save_dir: QuestionnaireClient, ... }
+        self.deferred = {}  # { save_dir: { rid: 回答哈希, ... }, ... }，监视模式中暂缓重试的预约，回答未变时跳过
+
+    @classmethod
+    def create(cls, query_workers: int = 8, rate_limit: float = 5, download_workers: int = 4, download_retries: int = 2,
+               downloader_script_dir: str = None, cloud_downloader: str = "builtin", cloud_url: str = CLOUD_URL,
+               profile_dir: str = None, browser_port: int = None, keep_browser: bool = False) -> "BatchContext":
+        """ 按 `main_batch` 的同名参数创建共享资源。"""
+        if cloud_downloader == "script" and not downloader_script_dir:
+            logging.warning("未配置 THU-Cloud-Downloader 脚本目录，将使用进程内下载器")
+        script_dir = downloader_script_dir if cloud_downloader == "script" else None
+        return cls(ThreadPoolExecutor(max_workers=max(1, query_workers)), RateLimiter(rate_limit),
+                   BrowserHost(profile_dir, browser_port, keep_browser),
+                   DownloadScheduler(script_dir, workers=download_workers, retries=download_retries, cloud_url=cloud_url))
+
+    def close(self):
+        """ 等待全部下载完成，关闭接口客户端、查询会话、线程池和浏览器。"""
+        self.scheduler.join()
+        for client in self.clients.values():
+            client.session.close()
+        for session in self.sessions.values():
+            session.close()
+        self.executor.shutdown()
+        self.browser.close()
 
 
 def main(questionnaire: str, password: str,
-         downloader_script_dir: str, 
+         downloader_script_dir: str = None, 
          date_start: str = None, date_length: int = 7,
-         save_dir: str = None):
-    # 初始化浏览器对象
+         save_dir: str = None,
+         api_mode: bool = False,
+         max_workers: int = 4, rate_limit: float = 5,
+         download_workers: int = 2, download_retries: int = 2,
+         incremental: bool = True,
+         cloud_downloader: str = "builtin",
+         page_size: int = 100, range_query: bool = False,
+         session_cache: bool = True, profile_dir: str = None, browser_port: int = None,
+         keep_browser: bool = False,
+         cloud_url: str = CLOUD_URL, export_pdf: bool = True, record_dir: str = None,
+         wait_timeout: float = 10, wait_retries: int = 2,
+         report_renderer: str = "pandoc",
+         image_processing: bool = False, thumbnail_size: int = 320, image_workers: int = None,
+         field_schema=None, media_store: bool = True, media_links: str = "hardlink",
+         batch: "BatchContext" = None):
+    # 批量模式中全局设置、运行指标和下载调度器由 main_batch 统一管理
+    standalone = batch is None
+    started = time.perf_counter()
+    summary = {"questionnaire": questionnaire, "save_dir": save_dir, "bookings": 0, "unchanged": 0, "deferred": 0,
+               "video_failures": 0, "report": "", "elapsed": 0, "error": None, "responses": {}, "failed": []}
+    drained = False     # 已提交的下载任务是否已全部完成
+    if standalone:
+        metrics.reset()
+        waits.configure(timeout=wait_timeout, retries=wait_retries)
+        if record_dir:
+            recorder.start(record_dir)
+        else:
+            recorder.stop()
     try:
-        co = ChromiumOptions()
-        co.headless()
-        co.remove_argument('--proxy-server')
-        co.set_argument('--no-proxy-server')
-        page = ChromiumPage(addr_or_opts=co)
-
-        verify_password(page, questionnaire, password)
-
+        if standalone:
+            schema.configure(field_schema)
         if not date_start:
             date_start = datetime.date.today()
         else:
@@ -408,30 +2683,352 @@ def main(questionnaire: str, password: str,
 
         if not save_dir:
             save_dir = os.path.join(os.getcwd(), "output")
+        summary['save_dir'] = save_dir
         if not os.path.exists(save_dir):
             logging.warning(f"保存目录不存在，将创建新目录\n- save dir: {save_dir}")
+        index = SyncIndex(save_dir) if incremental else None
+        media = MediaStore(save_dir, media_links) if media_store else None
+
+        # 浏览器在首次需要时才启动；接口模式下缓存的凭据有效时无需启动浏览器
+        session = batch.sessions.get(save_dir) if batch else None
+        if session is None:
+            session = SessionManager(questionnaire, password,
+                                     cache_path=os.path.join(save_dir, "session_cache.json") if session_cache else None,
+                                     profile_dir=profile_dir, browser_port=browser_port, keep_browser=keep_browser,
+                                     browser=batch.browser if batch else None)
+            if batch:
+                batch.sessions[save_dir] = session
+
+        if not isinstance(max_workers, int) or max_workers <= 0:
+            max_workers = 1
+        rate_limiter = batch.rate_limiter if batch else RateLimiter(rate_limit)
 
+        client = batch.clients.get(save_dir) if batch else None
+        page = session.page if client is not None and session.verified else None
+        if api_mode and client is None:
+            credentials = session.credentials()
+            if credentials and not (session.verified or 'search' in credentials['templates']
+                                    and 'upload_file' in credentials['templates']):
+                # 缓存的凭据缺少请求模板，需要已验证的浏览器页面回退查询以捕获模板
+                credentials = session.reverify()
+            if credentials:
+                client = QuestionnaireClient(questionnaire, credentials, pool_size=max(8, max_workers),
+                                             rate_limiter=rate_limiter, page_size=page_size, max_workers=max_workers,
+                                             reauthenticate=session.reverify, executor=batch.executor if batch else None)
+                page = session.page if session.verified else None
+                if batch:
+                    batch.clients[save_dir] = client
+            else:
+                logging.warning("密码验证未返回凭据，无法启用接口模式，将使用浏览器查询")
+
+        # 查询今天起向后 date_length 天的数据
+        dates = [(date_start + datetime.timedelta(days=delta)).strftime("%Y-%m-%d") for delta in range(date_length)]
         result = []
-        for delta in range(date_length):
-            # 查询今天起向后 date_length 天的数据
-            date = (date_start + datetime.timedelta(days=delta)).strftime("%Y-%m-%d")
-            result.extend(get_questionnaire_data(page, questionnaire, date))
+        if client is not None and not client.can_search():
+            # 首次查询在浏览器中完成，同时捕获 search 请求模板
+            result.extend(sorted(get_questionnaire_data(page, questionnaire, dates[0], save_dir, client.templates, index),
+                                 key=lambda item: item['seq']))
+            dates = dates[1:]
+            if not client.can_search():
+                logging.warning("未捕获到可重放的 search 请求模板，其余日期使用浏览器查询")
+        if client is None or not client.can_search():
+            tab_pool = session.tab_pool(min(max_workers, date_length))
+
+            def fetch(date: str) -> list:
+                with tab_pool.tab() as tab:
+                    rate_limiter.wait("https://wenjuan.tsinghua.edu.cn/")
+                    return get_questionnaire_data(tab, questionnaire, date, save_dir, index=index)
+        else:
+            def fetch(date: str) -> list:
+                return get_questionnaire_data_api(client, date, save_dir, page, index)
 
+            if range_query and len(dates) > 1:
+                if client.can_search() and client.supports_range() and client.can_fetch_file():
+                    # 一次范围查询取代逐日查询
+                    range_result = get_questionnaire_data_api(client, dates[0], save_dir, index=index, date_to=dates[-1])
+                    result.extend(sorted(range_result, key=lambda item: (schema.bind(item['questions']).answer('date'), item['seq'])))
+                    dates = []
+                else:
+                    logging.info("search 请求模板不支持日期范围查询，或尚未捕获全部请求模板，将逐日查询")
+        result.extend(fetch_dates(dates, fetch, max_workers, batch.executor if batch else None))
+
+        # 预约信息立即写入存储，视频在后台并发下载，完成后再更新链接
+        store = BookingStore(save_dir)
+        if batch:
+            script_dir = batch.scheduler.downloader_script_dir
+            scheduler = batch.scheduler
+        else:
+            if cloud_downloader == "script" and not downloader_script_dir:
+                logging.warning("未配置 THU-Cloud-Downloader 脚本目录，将使用进程内下载器")
+            script_dir = downloader_script_dir if cloud_downloader == "script" else None
+            scheduler = DownloadScheduler(script_dir, workers=download_workers, retries=download_retries, cloud_url=cloud_url)
         file_path = ""
+        metrics.count("bookings", len(result))
+        summary['bookings'] = len(result)
+        deferred = batch.deferred.get(save_dir, {}) if batch else {}
+        processed = []
         for item in result:
-            file_path = dump_booking_info(item['seq'], item['rid'], item['questions'], save_dir, downloader_script_dir)
+            response_hash = SyncIndex.response_hash(item['questions'])
+            summary['responses'][item['rid']] = response_hash
+            if item.get('unchanged'):
+                metrics.count("bookings_unchanged")
+                summary['unchanged'] += 1
+                continue
+            if deferred.get(item['rid']) == response_hash:
+                # 回答未变且文件未能全部保存的预约按各自的退避时间重试，此前跳过
+                metrics.count("bookings_deferred")
+                summary['deferred'] += 1
+                continue
+            processed.append(item)
+            file_path = dump_booking_info(item['seq'], item['rid'], item['questions'], save_dir, script_dir,
+                                          scheduler, index, store, media)
+        store.save()
+        if standalone:
+            scheduler.join()
+        else:
+            # 共享的调度器中只等待本问卷的下载任务
+            scheduler.wait(save_dir)
+        drained = True
+        summary['video_failures'] = sum(1 for entry in store.entries.values() if entry.get('video') == "下载失败")
+        # 视频或封面未能全部保存的预约没有记入同步索引
+        summary['failed'] = [item['rid'] for item in processed if not index.is_unchanged(item)] if index else \
+            [item['rid'] for item in processed if store.entries.get(item['rid'], {}).get('video') == "下载失败"]
+        if media:
+            media.prune()
         if file_path:
+            if image_processing:
+                # 封面全部下载完成后在进程池中生成缩略图和裁剪版本，报告中嵌入预览
+                store.set_previews(ImageProcessor(save_dir, image_workers, thumbnail_size).process(store.covers()))
+            # 全部下载结束后一次性生成 Markdown 文件
+            store.save()
+            file_path = store.render()
+            summary['report'] = file_path
+            # 按日期分节渲染报告，只重新转换有变化的日期
+            report = ReportRenderer(save_dir, report_renderer, max_workers, browser=lambda: session.browser.page)
             try:
-                output = pypandoc.convert_file(file_path, 'pdf', outputfile=file_path.replace(".md", ".pdf"))
-            except OSError as e:
-                logging.warning(f"Pandoc 转换 PDF 失败，可能是系统中未安装 Pandoc 或相关依赖，或文件路径中包含特殊字符导致转换失败\n- file path: {file_path}\n- error: {e}")
+                report.render(store.sections(), export_pdf)
+            except (OSError, RuntimeError) as e:
+                if report_renderer == "html":
+                    logging.warning(f"浏览器导出 PDF 失败\n- file path: {file_path}\n- error: {e}")
+                else:
+                    logging.warning(f"Pandoc 转换 PDF 失败，可能是系统中未安装 Pandoc 或相关依赖，或文件路径中包含特殊字符导致转换失败\n- file path: {file_path}\n- error: {e}")
 
     except Exception as e:
         logging.exception(f"程序出错：\n- error: {e}")
+        summary['error'] = str(e)
+    finally:
+        if not drained and 'scheduler' in locals():
+            # 出错时也等待已提交的下载完成并保存预约信息，使同步索引中的记录都能在存储中找到
+            try:
+                scheduler.join() if standalone else scheduler.wait(save_dir)
+            finally:
+                if 'store' in locals():
+                    store.save()
+        if 'index' in locals() and index is not None:
+            index.save()
+        if 'media' in locals() and media is not None:
+            media.save()
+        # 批量模式中的会话和客户端由 BatchContext 保留复用
+        if standalone and 'client' in locals() and client is not None:
+            client.session.close()
+        if 'session' in locals():
+            session.close() if standalone else session.save()
+        if standalone and save_dir:
+            try:
+                metrics.report(save_dir)
+            except OSError as e:
+                logging.warning(f"运行指标写入失败：\n- save dir: {save_dir}\n- error: {e}")
+        summary['elapsed'] = time.perf_counter() - started
+        logging.info("页面已关闭，程序结束。" if standalone else f"问卷处理结束：\n- questionnaire: {questionnaire}")
+    return summary
+
+
+def main_batch(questionnaires: list, save_dir: str = None, query_workers: int = 8, max_questionnaires: int = None,
+               rate_limit: float = 5, download_workers: int = 4, download_retries: int = 2,
+               downloader_script_dir: str = None, cloud_downloader: str = "builtin", cloud_url: str = CLOUD_URL,
+               profile_dir: str = None, browser_port: int = None, keep_browser: bool = False,
+               record_dir: str = None, wait_timeout: float = 10, wait_retries: int = 2, field_schema=None,
+               **defaults) -> list:
+    """ 批量处理多个问卷：全部问卷的日期查询提交到同一个有界线程池，视频下载提交到同一个下载调度器，并共用一个浏览器实例。
+
+    每个问卷仍按 `main` 的流程处理，输出到各自的保存目录（默认为 `{save_dir}/{questionnaire}`），某个问卷的下载全部完成后即生成其报告。
+    全部问卷结束后，在 _save_dir_ 中写入汇总的运行指标和 `batch_summary.json`，并在终端打印汇总表。
+
+    Args:
+        questionnaires (list): 问卷配置列表，每项至少包含 _questionnaire_ 和 _password_，其余字段为该问卷的 `main` 参数，覆盖 _defaults_
+        save_dir (str, optional): 批量输出的根目录，默认为当前目录下的 `output`
+        query_workers (int, optional): 共享的查询线程池大小，默认为 8
+        max_questionnaires (int, optional): 同时处理的最大问卷数，默认为空，即全部同时处理
+        rate_limit (float, optional): 全部问卷合计的每台主机每秒最大请求数，默认为 5
+        download_workers (int, optional): 共享的下载工作线程数，默认为 4
+        download_retries (int, optional): 单个下载任务的最大重试次数，默认为 2
+        downloader_script_dir (str, optional): THU-Cloud-Downloader 脚本所在目录，仅在 _cloud_downloader_ 为 "script" 时使用
+        cloud_downloader (str, optional): 视频下载方式，含义同 `main`，默认为 "builtin"
+        cloud_url (str, optional): 云盘服务地址，默认为 `CLOUD_URL`
+        profile_dir (str, optional): 共享浏览器的用户数据目录
+        browser_port (int, optional): 共享浏览器的调试端口
+        keep_browser (bool, optional): 结束时是否保留浏览器，默认为 False
+        record_dir (str, optional): 离线夹具的录制目录，默认不录制
+        wait_timeout (float, optional): 浏览器等待的初始及最长超时时间（秒），默认为 10
+        wait_retries (int, optional): 等待超时后的最大重试次数，默认为 2
+        field_schema (dict | str, optional): 全部问卷共用的字段映射规则，按问题列表结构分别编译，默认按问题顺序匹配
+        **defaults: 各问卷共同的其他 `main` 参数，如 _api_mode_、_date_length_
+
+    Returns:
+        summaries (list): 各问卷的处理结果，格式同 `main` 的返回值
+    """
+    metrics.reset()
+    waits.configure(timeout=wait_timeout, retries=wait_retries)
+    if record_dir:
+        recorder.start(record_dir)
+    else:
+        recorder.stop()
+    schema.configure(field_schema)
+    save_dir = save_dir or os.path.join(os.getcwd(), "output")
+
+    shared_options = ("rate_limit", "download_workers", "download_retries", "downloader_script_dir", "cloud_downloader",
+                      "cloud_url", "profile_dir", "browser_port", "keep_browser", "record_dir", "wait_timeout",
+                      "wait_retries", "field_schema")
+    configs, seen = [], set()
+    for config in questionnaires:
+        ignored = [key for key in shared_options if key in config]
+        if ignored:
+            logging.warning(f"批量模式中以下参数由全部问卷共享，问卷中的设置将被忽略：\n- questionnaire: {config.get('questionnaire')}\n- options: {', '.join(ignored)}")
+        config = {**defaults, **config}
+        config['save_dir'] = config.get('save_dir') or os.path.join(save_dir, config['questionnaire'])
+        if os.path.abspath(config['save_dir']) in seen:
+            logging.warning(f"问卷的保存目录重复，已跳过：\n- questionnaire: {config['questionnaire']}\n- save dir: {config['save_dir']}")
+            continue
+        seen.add(os.path.abspath(config['save_dir']))
+        configs.append(config)
+
+    batch = BatchContext.create(query_workers, rate_limit, download_workers, download_retries, downloader_script_dir,
+                                cloud_downloader, cloud_url, profile_dir, browser_port, keep_browser)
+    logging.info(f"开始批量处理：\n- questionnaires: {len(configs)}\n- query workers: {query_workers}\n- download workers: {download_workers}")
+    summaries = []
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, max_questionnaires or len(configs) or 1)) as runners:
+            futures = [runners.submit(main, **config, batch=batch) for config in configs]
+            summaries = [future.result() for future in futures]
+    finally:
+        batch.close()
+        try:
+            metrics.report(save_dir)
+            # 各预约的回答哈希只供监视模式比较，不写入汇总
+            _atomic_write(os.path.join(save_dir, "batch_summary.json"), json.dumps(
+                [{key: value for key, value in summary.items() if key != 'responses'} for summary in summaries],
+                ensure_ascii=False, indent=2))
+        except OSError as e:
+            logging.warning(f"批量处理汇总写入失败：\n- save dir: {save_dir}\n- error: {e}")
+
+    table = Table(title="批量处理汇总")
+    for column in ("问卷", "预约数", "未变化", "视频下载失败", "耗时 (s)", "状态"):
+        table.add_column(column, justify="left" if column in ("问卷", "状态") else "right")
+    for summary in summaries:
+        table.add_row(summary['questionnaire'], str(summary['bookings']), str(summary['unchanged']),
+                      str(summary['video_failures']), f"{summary['elapsed']:.1f}",
+                      "出错" if summary['error'] else "完成")
+    console.print(table)
+    return summaries
+
+
+def watch(questionnaire: str, password: str, save_dir: str = None, date_length: int = 7,
+          watch_days: int = 2, poll_interval: float = 10, max_interval: float = 300, backoff: float = 2,
+          rescan_interval: float = 3600, max_polls: int = None, query_workers: int = 4,
+          rate_limit: float = 5, download_workers: int = 2, download_retries: int = 2,
+          downloader_script_dir: str = None, cloud_downloader: str = "builtin", cloud_url: str = CLOUD_URL,
+          profile_dir: str = None, browser_port: int = None, keep_browser: bool = False,
+          record_dir: str = None, wait_timeout: float = 10, wait_retries: int = 2, field_schema=None,
+          **options):
+    """ 监视模式：常驻运行并定期轮询新的预约，会话、接口客户端、浏览器和下载调度器在各轮之间保持，不必重复启动浏览器和验证密码。
+
+    每轮以 `main` 的流程处理，但只查询今天起 _watch_days_ 天的数据，每隔 _rescan_interval_ 秒才完整查询一次 _date_length_ 天；
+    增量同步始终开启，未变化的预约直接跳过。某轮发现新增或回答有变化的预约时立即下载并重新生成报告，轮询间隔重置为 _poll_interval_；
+    没有变化时不生成报告，间隔乘以 _backoff_，最长为 _max_interval_。视频或封面未能全部保存的预约不计为变化，按各自的失败次数退避重试，
+    第 n 次失败后等待 `poll_interval * backoff ** n` 秒（最长 _max_interval_），其间的轮询跳过该预约；回答变化时立即重新处理。
+    按 Ctrl+C 结束，结束前等待进行中的下载完成并写入运行指标。
+
+    Args:
+        questionnaire (str): 问卷查询链接的标识符
+        password (str): 问卷查询的密码
+        save_dir (str, optional): 保存目录路径，默认为当前目录下的 `output`
+        date_length (int, optional): 完整查询的天数，默认为 7
+        watch_days (int, optional): 每轮查询的天数，默认为 2
+        poll_interval (float, optional): 最短轮询间隔（秒），默认为 10
+        max_interval (float, optional): 最长轮询间隔（秒），默认为 300
+        backoff (float, optional): 没有变化时轮询间隔的增长倍数，默认为 2
+        rescan_interval (float, optional): 完整查询的间隔（秒），默认为 3600
+        max_polls (int, optional): 最大轮询次数，默认为空，即一直运行
+        query_workers (int, optional): 查询线程池大小，默认为 4
+        **options: 其他参数含义同 `main_batch` 的同名参数或 `main` 的参数，如 _api_mode_、_export_pdf_
+    """
+    metrics.reset()
+    waits.configure(timeout=wait_timeout, retries=wait_retries)
+    if record_dir:
+        recorder.start(record_dir)
+    else:
+        recorder.stop()
+    schema.configure(field_schema)
+    save_dir = save_dir or os.path.join(os.getcwd(), "output")
+    options.pop('date_start', None)     # 每轮都从当天开始查询
+    options['incremental'] = True
+
+    batch = BatchContext.create(query_workers, rate_limit, download_workers, download_retries, downloader_script_dir,
+                                cloud_downloader, cloud_url, profile_dir, browser_port, keep_browser)
+    logging.info(f"开始监视：\n- questionnaire: {questionnaire}\n- watch days: {watch_days}\n- poll interval: {poll_interval}s ~ {max_interval}s")
+    interval = poll_interval
+    last_rescan = None
+    polls = 0
+    seen = {}       # { rid: 上次轮询时的回答哈希, ... }
+    failures = {}   # { rid: {"hash": 失败时的回答哈希, "attempts": 连续失败次数, "retry_at": 下次重试的时间}, ... }
+    try:
+        while max_polls is None or polls < max_polls:
+            now = time.monotonic()
+            full = last_rescan is None or now - last_rescan >= rescan_interval
+            if full:
+                last_rescan = now
+            deferred = {rid: failure['hash'] for rid, failure in failures.items() if failure['retry_at'] > now}
+            batch.deferred[save_dir] = deferred
+            summary = main(questionnaire, password, save_dir=save_dir,
+                           date_length=date_length if full else min(watch_days, date_length), batch=batch, **options)
+            polls += 1
+
+            # 只有回答与上次轮询不同的预约才算变化，下载失败后重试的预约不影响轮询间隔
+            changed = sum(seen.get(rid) != response_hash for rid, response_hash in summary['responses'].items())
+            seen.update(summary['responses'])
+            for rid, response_hash in summary['responses'].items():
+                if deferred.get(rid) == response_hash:
+                    continue
+                if rid not in summary['failed']:
+                    failures.pop(rid, None)
+                    continue
+                failure = failures.get(rid)
+                attempts = failure['attempts'] + 1 if failure and failure['hash'] == response_hash else 1
+                delay = min(max_interval, poll_interval * backoff ** attempts)
+                failures[rid] = {"hash": response_hash, "attempts": attempts, "retry_at": time.monotonic() + delay}
+                logging.warning(f"预约文件未能全部保存，稍后重试：\n- rid: {rid}\n- attempts: {attempts}\n- retry in: {delay:.1f}s")
+
+            metrics.count("polls")
+            if changed:
+                metrics.count("polls_changed")
+                interval = poll_interval
+            else:
+                interval = min(max_interval, interval * backoff)
+            # 有预约等待重试时提前醒来，但不短于最短轮询间隔
+            now = time.monotonic()
+            retries = [failure['retry_at'] - now for failure in failures.values() if failure['retry_at'] > now]
+            sleep = max(poll_interval, min([interval] + retries))
+            logging.info(f"轮询完成：\n- scan: {'full' if full else 'recent'}\n- bookings: {summary['bookings']}\n- changed: {changed}\n- deferred: {summary['deferred']}\n- next poll: {sleep:.1f}s")
+            if max_polls is None or polls < max_polls:
+                time.sleep(sleep)
+    except KeyboardInterrupt:
+        logging.info("已中断监视，等待进行中的下载完成后退出")
     finally:
-        if 'page' in locals():
-            page.quit()
-        logging.info("页面已关闭，程序结束。")
+        batch.close()
+        try:
+            metrics.report(save_dir)
+        except OSError as e:
+            logging.warning(f"运行指标写入失败：\n- save dir: {save_dir}\n- error: {e}")
 
 
 if __name__ == "__main__":